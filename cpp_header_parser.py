@@ -0,0 +1,435 @@
+'''
+    Shared C++ header parser for gtest_generator and stub_generator
+    The header is tokenized by one compiled regex and parsed in a single linear pass that
+    tracks brace depth, so multi-line declarations, nested namespaces, inline function bodies
+    and default arguments are handled, and the "};" of a function body is never taken as the
+    end of a class.
+    Known issues:
+    1. Preprocessor conditionals are ignored, both branches of #if/#else are parsed
+    2. Templates (class and function) are skipped
+    3. A function returning a function pointer, e.g. void (*getCallback())(int), is not recognized
+    4. An export macro is only skipped in a class head, class API Foo; is not a forward declaration of Foo
+'''
+
+import re
+from enum import Enum
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<preprocessor>\#(?:\\\n|[^\n])*)
+  | (?P<string>[uUL8]*R"(?P<delimiter>[^(\s]*)\(.*?\)(?P=delimiter)"|[uUL8]*"(?:\\.|[^"\\\n])*"|[uUL8]*'(?:\\.|[^'\\\n])*')
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<number>\.?\d(?:[\w.]|[eEpP][+-])*)
+  | (?P<punct>::|\.\.\.|->|&&|\[\[|\]\]|.)
+""", re.VERBOSE | re.DOTALL)
+
+ACCESS_SPECIFIERS = {"public": 2, "private": 1, "protected": 3}
+
+CLASS_KEYS = {"class", "struct", "union"}
+
+DECLARATION_SPECIFIERS = {"virtual", "static", "inline", "explicit", "constexpr", "consteval", "extern", "friend", "mutable"}
+
+TYPE_KEYWORDS = {"void", "bool", "char", "wchar_t", "char8_t", "char16_t", "char32_t", "short", "int", "long",
+                 "float", "double", "signed", "unsigned", "auto", "const", "volatile"}
+
+CV_QUALIFIERS = {"const", "volatile", "struct", "class", "enum", "typename"}
+
+SKIPPED_STATEMENT_KEYWORDS = {"template", "typedef", "using", "friend", "static_assert", "enum", "namespace"}
+
+ATTRIBUTE_KEYWORDS = {"__attribute__", "alignas", "__declspec"}
+
+class ClassAccessControl(Enum):
+    PRIVATE = 1
+    PUBLIC = 2
+    PROTECTED = 3
+
+class DeclarationKind(Enum):
+    NAMESPACE_BEGIN = 1
+    NAMESPACE_END = 2
+    CLASS_BEGIN = 3
+    CLASS_END = 4
+    ACCESS = 5
+    CONSTRUCTER = 6
+    FUNCTION = 7
+    FORWARD_DECLARATION = 8
+    TYPEDEF = 9
+
+class Argument:
+    def __init__(self, type, name=None, default=None):
+        self.type = type
+        self.name = name
+        self.default = default
+
+    def __eq__(self, other):
+        return type(other) is Argument and vars(self) == vars(other)
+
+    def declaration(self):
+        if self.name is None:
+            return self.type
+        if self.type.endswith(")"):
+            # function pointer, the name goes inside the first parentheses
+            return self.type.replace("(*)", "(*" + self.name + ")", 1)
+        return self.type + " " + self.name
+
+class Declaration:
+    def __init__(self, kind, name=None, qualified_name=None, class_name=None, access=None,
+                 return_type=None, args=None, specifiers=None, qualifiers=None, has_body=False):
+        self.kind = kind
+        self.name = name
+        self.qualified_name = qualified_name
+        self.class_name = class_name
+        self.access = access
+        self.return_type = return_type
+        self.args = args
+        self.specifiers = specifiers if specifiers is not None else []
+        self.qualifiers = qualifiers if qualifiers is not None else []
+        self.has_body = has_body
+
+    def __eq__(self, other):
+        return type(other) is Declaration and vars(self) == vars(other)
+
+    def argsDeclaration(self):
+        return ", ".join(arg.declaration() for arg in self.args)
+
+def tokenize(text):
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == "delimiter":
+            kind = "string"
+        if kind == "space" or kind == "comment":
+            continue
+        yield kind, match.group()
+
+def isWord(token):
+    return token[0].isalpha() or token[0] == "_"
+
+def joinTokens(tokens):
+    text = ""
+    previous = None
+    for token in tokens:
+        if previous is not None and (isWord(token) or token[0].isdigit()) and (isWord(previous) or previous[0].isdigit() or previous in ("*", "&", "&&", ">", ",")):
+            text += " "
+        elif previous == "," or token == "...":
+            text += " "
+        text += token
+        previous = token
+    return text
+
+def findClosing(tokens, start):
+    # index of the bracket closing tokens[start]
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i] in ("(", "[", "{"):
+            depth += 1
+        elif tokens[i] in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+def stripAttributes(tokens):
+    # [[...]], __attribute__((...)), alignas(...) and __declspec(...) never name a class or function
+    stripped = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "[[":
+            i = tokens.index("]]", i) + 1 if "]]" in tokens[i:] else len(tokens)
+        elif tokens[i] in ATTRIBUTE_KEYWORDS:
+            i = findClosing(tokens, i + 1) + 1 if i + 1 < len(tokens) and tokens[i + 1] == "(" else i + 1
+        else:
+            stripped.append(tokens[i])
+            i += 1
+    return stripped
+
+def className(tokens):
+    # the last word of a class head before final or the base clause, so export macros are skipped
+    name = None
+    i = 1
+    while i < len(tokens) and tokens[i] not in (":", "final"):
+        if tokens[i] == "(":
+            i = findClosing(tokens, i)
+        elif isWord(tokens[i]):
+            name = tokens[i]
+        i += 1
+    return name
+
+def splitTopLevel(tokens, separator):
+    parts = [[]]
+    depth = 0
+    angle_depth = 0
+    for token in tokens:
+        if token in ("(", "[", "{"):
+            depth += 1
+        elif token in (")", "]", "}"):
+            depth -= 1
+        elif token == "<" and depth == 0:
+            angle_depth += 1
+        elif token == ">" and depth == 0 and angle_depth > 0:
+            angle_depth -= 1
+        elif token == separator and depth == 0 and angle_depth == 0:
+            parts.append([])
+            continue
+        parts[-1].append(token)
+    return parts
+
+def parseArgument(tokens):
+    declarator = splitTopLevel(tokens, "=")
+    default = joinTokens([token for part in declarator[1:] for token in part]) if len(declarator) > 1 else None
+    tokens = declarator[0]
+    if len(tokens) == 0 or tokens == ["void"]:
+        return None
+    if tokens == ["..."]:
+        return Argument("...")
+
+    # function pointer: ret (*name)(args)
+    if "(" in tokens and tokens.index("(") + 1 < len(tokens) and tokens[tokens.index("(") + 1] == "*":
+        start = tokens.index("(")
+        end = findClosing(tokens, start)
+        names = [token for token in tokens[start + 2:end] if isWord(token)]
+        name = names[-1] if len(names) > 0 else None
+        type_tokens = [token for token in tokens if token != name]
+        return Argument(joinTokens(type_tokens), name, default)
+
+    # array: type name[N] is passed as a pointer
+    if "[" in tokens:
+        tokens = tokens[:tokens.index("[")] + ["*"]
+        tokens = tokens[:-2] + ["*", tokens[-2]] if len(tokens) > 2 and isWord(tokens[-2]) else tokens
+
+    name = None
+    if len(tokens) > 1 and isWord(tokens[-1]) and tokens[-1] not in TYPE_KEYWORDS and tokens[-2] != "::":
+        if any(token not in CV_QUALIFIERS for token in tokens[:-1]):
+            name = tokens[-1]
+            tokens = tokens[:-1]
+    return Argument(joinTokens(tokens), name, default)
+
+def parseArguments(tokens):
+    args = []
+    for arg_tokens in splitTopLevel(tokens, ","):
+        arg = parseArgument(arg_tokens)
+        if arg is not None:
+            args.append(arg)
+    return args
+
+class HeaderParser:
+    def __init__(self, text):
+        self.text = text
+        self.scopes = []
+        self.includes = []
+
+    def currentClass(self):
+        for scope in reversed(self.scopes):
+            if scope[0] == DeclarationKind.CLASS_BEGIN:
+                return scope
+            if scope[0] == DeclarationKind.NAMESPACE_BEGIN:
+                return None
+        return None
+
+    def qualifiedName(self, name, kind):
+        names = [scope[1] for scope in self.scopes if scope[0] == kind and scope[1] is not None]
+        if name is not None:
+            names.append(name)
+        return "::".join(names) if len(names) > 0 else None
+
+    def parseFunction(self, tokens, has_body):
+        cur_class = self.currentClass()
+        if len(tokens) == 0 or tokens[0] in SKIPPED_STATEMENT_KEYWORDS or "operator" in tokens:
+            return None
+
+        # the name is the word right before the first "(" outside of template arguments,
+        # so std::function<void(int)> is a type and not a function named void
+        start = None
+        angle_depth = 0
+        for i, token in enumerate(tokens):
+            if token == "<":
+                angle_depth += 1
+            elif token == ">" and angle_depth > 0:
+                angle_depth -= 1
+            elif angle_depth > 0:
+                continue
+            elif token == "(":
+                start = i
+                break
+            elif token in ("=", "{", "[", ":") :
+                return None
+        if start is None or start == 0 or not isWord(tokens[start - 1]) or tokens[start - 1] in TYPE_KEYWORDS:
+            return None
+        name = tokens[start - 1]
+        prefix = tokens[:start - 1]
+        if len(prefix) > 0 and prefix[-1] in ("~", "::"):
+            return None
+        end = findClosing(tokens, start)
+        args = parseArguments(tokens[start + 1:end])
+
+        specifiers = [token for token in prefix if token in DECLARATION_SPECIFIERS]
+        return_tokens = [token for token in prefix if token not in DECLARATION_SPECIFIERS]
+        qualifiers = []
+        for token in tokens[end + 1:]:
+            if token == ":":
+                break
+            qualifiers.append(token)
+        if "delete" in qualifiers:
+            return None
+
+        access = cur_class[2] if cur_class is not None else None
+        class_name = cur_class[3] if cur_class is not None else None
+        if len(return_tokens) == 0:
+            if cur_class is None or name != cur_class[1]:
+                return None
+            return Declaration(DeclarationKind.CONSTRUCTER, name, class_name=class_name, access=access,
+                               args=args, specifiers=specifiers, qualifiers=qualifiers, has_body=has_body)
+        return Declaration(DeclarationKind.FUNCTION, name, class_name=class_name, access=access,
+                           return_type=joinTokens(return_tokens), args=args, specifiers=specifiers,
+                           qualifiers=qualifiers, has_body=has_body)
+
+    def parseTypeDeclaration(self, tokens):
+        # forward declarations and aliases, the alias target is kept in return_type
+        cur_class = self.currentClass()
+        access = cur_class[2] if cur_class is not None else None
+        class_name = cur_class[3] if cur_class is not None else None
+        namespace = self.qualifiedName(None, DeclarationKind.NAMESPACE_BEGIN)
+        if len(tokens) == 2 and tokens[0] in CLASS_KEYS and isWord(tokens[1]):
+            return Declaration(DeclarationKind.FORWARD_DECLARATION, tokens[1], namespace, class_name=class_name, access=access)
+        if len(tokens) > 2 and tokens[0] == "typedef" and isWord(tokens[-1]) and "(" not in tokens:
+            return Declaration(DeclarationKind.TYPEDEF, tokens[-1], namespace, class_name=class_name, access=access,
+                               return_type=joinTokens(tokens[1:-1]))
+        if len(tokens) > 5 and tokens[0] == "typedef" and "(" in tokens and tokens[tokens.index("(") + 1] == "*":
+            # typedef void (*Callback)(int); is declared like a function pointer argument
+            alias = parseArgument(tokens[1:])
+            if alias is not None and alias.name is not None:
+                return Declaration(DeclarationKind.TYPEDEF, alias.name, namespace, class_name=class_name, access=access,
+                                   return_type=alias.type)
+        if len(tokens) > 3 and tokens[0] == "using" and isWord(tokens[1]) and tokens[2] == "=":
+            return Declaration(DeclarationKind.TYPEDEF, tokens[1], namespace, class_name=class_name, access=access,
+                               return_type=joinTokens(tokens[3:]))
+        return None
+
+    def enterScope(self, tokens):
+        # returns the declarations opened by "{" and whether the body shall be skipped
+        if len(tokens) > 0 and tokens[0] == "inline":
+            tokens = tokens[1:]
+        if len(tokens) > 0 and tokens[0] == "namespace":
+            # "namespace a::b {" opens both namespaces in one scope
+            name = joinTokens(tokens[1:]) if len(tokens) > 1 else None
+            declarations = []
+            qualified_name = self.qualifiedName(None, DeclarationKind.NAMESPACE_BEGIN)
+            for cur_name in (name.split("::") if name is not None else [None]):
+                if cur_name is not None:
+                    qualified_name = cur_name if qualified_name is None else qualified_name + "::" + cur_name
+                declarations.append(Declaration(DeclarationKind.NAMESPACE_BEGIN, cur_name, qualified_name))
+            self.scopes.append((DeclarationKind.NAMESPACE_BEGIN, name))
+            return declarations, False
+
+        if len(tokens) > 1 and tokens[0] == "extern" and tokens[1][0] == "\"":
+            self.scopes.append((None, None))
+            return [], False
+
+        # a statement opened by a class key is a class head, or an anonymous class or initializer to skip
+        if len(tokens) > 0 and tokens[0] in CLASS_KEYS:
+            name = className(tokens) if "=" not in tokens else None
+            if name is None:
+                return [], True
+            outer = self.currentClass()
+            qualified_name = outer[3] + "::" + name if outer is not None else name
+            access = ClassAccessControl.PRIVATE if tokens[0] == "class" else ClassAccessControl.PUBLIC
+            self.scopes.append([DeclarationKind.CLASS_BEGIN, name, access, qualified_name])
+            return [Declaration(DeclarationKind.CLASS_BEGIN, name, self.qualifiedName(None, DeclarationKind.NAMESPACE_BEGIN),
+                                class_name=qualified_name, access=access)], False
+
+        function = self.parseFunction(tokens, True)
+        if function is not None:
+            return [function], True
+        return [], True
+
+    def leaveScope(self):
+        if len(self.scopes) == 0:
+            return []
+        scope = self.scopes.pop()
+        if scope[0] == DeclarationKind.NAMESPACE_BEGIN:
+            names = scope[1].split("::") if scope[1] is not None else [None]
+            return [Declaration(DeclarationKind.NAMESPACE_END, name) for name in reversed(names)]
+        if scope[0] == DeclarationKind.CLASS_BEGIN:
+            return [Declaration(DeclarationKind.CLASS_END, scope[1], class_name=scope[3])]
+        return []
+
+    def parse(self):
+        statement = []
+        depth = 0
+        skip_depth = 0
+        for kind, token in tokenize(self.text):
+            if kind == "preprocessor":
+                include = re.match(r"#\s*include\s*([<\"])([^>\"]+)[>\"]", token)
+                if include is not None:
+                    self.includes.append((include.group(2), include.group(1) == "<"))
+                continue
+
+            # inside a skipped body (function body, enum, template, initializer) only braces matter
+            if skip_depth > 0:
+                if token == "{":
+                    skip_depth += 1
+                elif token == "}":
+                    skip_depth -= 1
+                continue
+
+            if depth > 0:
+                statement.append(token)
+                if token in ("(", "["):
+                    depth += 1
+                elif token in (")", "]"):
+                    depth -= 1
+                continue
+
+            if token == ";":
+                statement = stripAttributes(statement)
+                if len(statement) > 0:
+                    function = self.parseFunction(statement, False)
+                    if function is None:
+                        function = self.parseTypeDeclaration(statement)
+                    if function is not None:
+                        yield function
+                statement = []
+            elif token == "{":
+                declarations, skip_body = self.enterScope(stripAttributes(statement))
+                yield from declarations
+                if skip_body:
+                    skip_depth = 1
+                statement = []
+            elif token == "}":
+                yield from self.leaveScope()
+                statement = []
+            elif token == ":" and len(statement) > 0 and statement[-1] in ACCESS_SPECIFIERS and self.currentClass() is not None:
+                access = ClassAccessControl(ACCESS_SPECIFIERS[statement[-1]])
+                self.currentClass()[2] = access
+                yield Declaration(DeclarationKind.ACCESS, access=access, class_name=self.currentClass()[3])
+                statement = []
+            else:
+                statement.append(token)
+                if token in ("(", "["):
+                    depth += 1
+
+class HeaderModel:
+    # declarations of one header in source order, parsed once and shared by all emitters
+    def __init__(self, file_name, declarations, includes):
+        self.file_name = file_name
+        self.declarations = declarations
+        self.includes = includes
+
+    def sameDeclarations(self, other):
+        # true when a reparse only changed comments, whitespace or skipped code
+        return other is not None and self.declarations == other.declarations and self.includes == other.includes
+
+    def classes(self):
+        return [declaration for declaration in self.declarations if declaration.kind == DeclarationKind.CLASS_BEGIN]
+
+    def functions(self):
+        return [declaration for declaration in self.declarations if declaration.kind == DeclarationKind.FUNCTION]
+
+def buildHeaderModel(file_name, text):
+    parser = HeaderParser(text)
+    declarations = list(parser.parse())
+    return HeaderModel(file_name, declarations, parser.includes)
+
+def parseHeaderModel(file_name):
+    with open(file_name, 'r') as file_object:
+        text = file_object.read()
+    return buildHeaderModel(file_name, text)
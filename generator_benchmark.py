@@ -0,0 +1,227 @@
+'''
+    Benchmark for gtest_generator and stub_generator
+    generate a synthetic C++ header corpus with many classes, long multi-line argument lists,
+    nested namespaces and inline bodies, then run each generator on it in its own process so
+    that its peak RSS can be reported, time spent reading, matching, emitting and writing is
+    taken from generator_output.GeneratorStats, lines/s and peak RSS are compared with a stored
+    baseline
+'''
+
+import sys
+import getopt
+import os
+import subprocess
+import tempfile
+import json
+import random
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generator_benchmark_baseline.json")
+
+DEFAULT_CLASS_COUNT = 200
+
+DEFAULT_METHOD_COUNT = 20
+
+DEFAULT_ARG_COUNT = 8
+
+DEFAULT_NAMESPACE_DEPTH = 3
+
+DEFAULT_TOLERANCE = 0.3
+
+STAGES = ["gtest", "stub"]
+
+BASE_CLASS_COUNT = 7
+
+ARG_TYPES = ["int", "long", "bool", "double", "unsigned long", "char*", "const char*", "const std::string&",
+             "std::vector<int>", "const std::map<int, std::string>&"]
+
+RETURN_TYPES = ["void", "int", "bool", "const char*", "std::string", "std::vector<int>"]
+
+INLINE_BODY_TEMPLATE = "{ int value = 0; if (value > 0) { return value; } return value; }"
+
+def generateArgs(rng, arg_count, indent):
+    # long argument lists are split over several lines like in hand written headers
+    args = []
+    for i in range(rng.randint(0, arg_count)):
+        if rng.random() < 0.05:
+            args.append("void (*callback{})(int, void*)".format(i))
+        else:
+            args.append("{} arg{}".format(rng.choice(ARG_TYPES), i))
+    if len(args) > 3:
+        return (",\n" + indent).join(args)
+    return ", ".join(args)
+
+def generateMethod(rng, name, arg_count, member=True):
+    return_type = rng.choice(RETURN_TYPES)
+    if member:
+        prefix = "    " + ("virtual " if rng.random() < 0.3 else "static " if rng.random() < 0.1 else "")
+    else:
+        prefix = "inline " if return_type == "int" else ""
+    head = "{}{} {}(".format(prefix, return_type, name)
+    args = generateArgs(rng, arg_count, " " * len(head))
+    suffix = " const" if member and rng.random() < 0.2 and "static" not in prefix else ""
+    if return_type == "int" and rng.random() < 0.3:
+        # inline bodies with nested braces have to be skipped by the parser
+        return "{}{}){} {}\n".format(head, args, suffix, INLINE_BODY_TEMPLATE)
+    return "{}{}){};\n".format(head, args, suffix)
+
+def generateHeaderCorpus(file_object, class_count=DEFAULT_CLASS_COUNT, method_count=DEFAULT_METHOD_COUNT,
+                         arg_count=DEFAULT_ARG_COUNT, namespace_depth=DEFAULT_NAMESPACE_DEPTH, seed=0):
+    rng = random.Random(seed)
+    file_object.write("#ifndef CORPUS_H\n#define CORPUS_H\n\n#include <map>\n#include <string>\n#include <vector>\n\n")
+    for depth in range(namespace_depth):
+        file_object.write("namespace corpus{}\n{{\n".format(depth))
+    for base_index in range(BASE_CLASS_COUNT):
+        file_object.write("class Base{}\n{{\npublic:\n    virtual ~Base{}();\n}};\n\n".format(base_index, base_index))
+    for class_index in range(class_count):
+        class_name = "Class{}".format(class_index)
+        file_object.write("/* {} of the corpus,\n   with a class Fake {{ }}; inside a comment */\n".format(class_name))
+        file_object.write("class {} : public Base{}\n{{\npublic:\n".format(class_name, class_index % BASE_CLASS_COUNT))
+        head = "    {}(".format(class_name)
+        file_object.write("{}{});\n".format(head, generateArgs(rng, arg_count, " " * len(head))))
+        file_object.write("    virtual ~{}();\n\n".format(class_name))
+        for method_index in range(method_count):
+            if method_index == method_count * 3 // 4:
+                file_object.write("protected:\n")
+            file_object.write(generateMethod(rng, "method{}".format(method_index), arg_count))
+        file_object.write("private:\n    int m_value = 0;\n};\n\n")
+    for function_index in range(class_count):
+        file_object.write(generateMethod(rng, "function{}".format(function_index), arg_count, False))
+    for depth in range(namespace_depth):
+        file_object.write("}\n")
+    file_object.write("\n#endif\n")
+
+def runStage(stage, corpus_file):
+    # runs inside the child process started by benchmarkStage
+    from generator_output import GeneratorStats
+    from header_model_cache import loadHeaderModel
+    import gtest_generator
+    import stub_generator
+
+    stats = GeneratorStats()
+    model = loadHeaderModel(corpus_file, stats=stats)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with stats.emitting():
+            if stage == "gtest":
+                gtest_generator.generateGtest(corpus_file, os.path.join(temp_dir, "test_corpus.cpp"), True, model)
+            else:
+                stub_generator.generateGtest(corpus_file, os.path.join(temp_dir, "unittest_stub-corpus.h"),
+                                             os.path.join(temp_dir, "unittest_stub-corpus.cpp"), model)
+    return stats.report()
+
+def benchmarkStage(stage, corpus_file):
+    command = [sys.executable, os.path.abspath(__file__), "--stage", stage, "-i", corpus_file]
+    return json.loads(subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout)
+
+def compareWithBaseline(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    failures = []
+    for stage, baseline_stage in baseline["stages"].items():
+        if stage not in result["stages"]:
+            continue
+        cur_stage = result["stages"][stage]
+        if cur_stage["lines_per_s"] < baseline_stage["lines_per_s"] * (1 - tolerance):
+            failures.append("{}: {:.0f} lines/s is below baseline {:.0f} lines/s".format(
+                stage, cur_stage["lines_per_s"], baseline_stage["lines_per_s"]))
+        if cur_stage["peak_rss"] > baseline_stage["peak_rss"] * (1 + tolerance):
+            failures.append("{}: peak rss {} bytes is above baseline {} bytes".format(
+                stage, cur_stage["peak_rss"], baseline_stage["peak_rss"]))
+    return failures
+
+def generatorBenchmark(class_count=DEFAULT_CLASS_COUNT, method_count=DEFAULT_METHOD_COUNT, arg_count=DEFAULT_ARG_COUNT,
+                       namespace_depth=DEFAULT_NAMESPACE_DEPTH, stages=STAGES):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_file = os.path.join(temp_dir, "corpus.h")
+        with open(corpus_file, "w") as file_object:
+            generateHeaderCorpus(file_object, class_count, method_count, arg_count, namespace_depth)
+        return {"class_count": class_count,
+                "method_count": method_count,
+                "arg_count": arg_count,
+                "namespace_depth": namespace_depth,
+                "size": os.path.getsize(corpus_file),
+                "stages": {stage: benchmarkStage(stage, corpus_file) for stage in stages}}
+
+def main(argv):
+    class_count = DEFAULT_CLASS_COUNT
+    method_count = DEFAULT_METHOD_COUNT
+    arg_count = DEFAULT_ARG_COUNT
+    namespace_depth = DEFAULT_NAMESPACE_DEPTH
+    baseline_file = DEFAULT_BASELINE_FILE
+    update_baseline = False
+    tolerance = DEFAULT_TOLERANCE
+    stage = None
+    input = None
+    generate = None
+
+    usage = ("usage: -c <classes> -m <methods_per_class> -a <max_args> --namespaces <depth> --baseline <file> "
+             "--update-baseline --tolerance <ratio> --generate <file>")
+
+    try:
+        opts, args = getopt.getopt(argv, "hc:m:a:i:", ["namespaces=", "baseline=", "update-baseline", "tolerance=",
+                                                       "generate=", "stage="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            print("with --generate, only a synthetic header corpus is written to <file>")
+            print("without --update-baseline, a stage slower or bigger than the baseline by more than <ratio> fails")
+            sys.exit()
+        elif opt in ("-c", "-m", "-a", "--namespaces", "--tolerance"):
+            try:
+                value = float(arg) if opt == "--tolerance" else int(arg)
+            except ValueError:
+                print("{} shall be a number".format(opt))
+                sys.exit(2)
+            if opt == "-c":
+                class_count = value
+            elif opt == "-m":
+                method_count = value
+            elif opt == "-a":
+                arg_count = value
+            elif opt == "--namespaces":
+                namespace_depth = value
+            else:
+                tolerance = value
+        elif opt == "--baseline":
+            baseline_file = arg
+        elif opt == "--update-baseline":
+            update_baseline = True
+        elif opt == "--generate":
+            generate = arg
+        elif opt == "--stage":
+            stage = arg
+        elif opt == "-i":
+            input = arg
+
+    if stage is not None:
+        print(json.dumps(runStage(stage, input)))
+        return
+
+    if generate is not None:
+        with open(generate, "w") as file_object:
+            generateHeaderCorpus(file_object, class_count, method_count, arg_count, namespace_depth)
+        return
+
+    result = generatorBenchmark(class_count, method_count, arg_count, namespace_depth)
+    corpus = [class_count, method_count, arg_count, namespace_depth]
+    failures = []
+
+    if update_baseline:
+        with open(baseline_file, "w") as file_object:
+            json.dump({"tolerance": tolerance, "corpus": corpus, "stages": result["stages"]}, file_object, indent=4)
+    elif os.path.exists(baseline_file):
+        with open(baseline_file) as file_object:
+            baseline = json.load(file_object)
+        if baseline["corpus"] != corpus:
+            print("baseline was recorded with -c {} -m {} -a {} --namespaces {}".format(*baseline["corpus"]))
+            sys.exit(2)
+        failures += compareWithBaseline(result, baseline, tolerance)
+
+    result["failures"] = failures
+    print(json.dumps(result, indent=4))
+    if len(failures) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,240 @@
+'''
+    Output file of gtest_generator and stub_generator
+    The content is written to a temporary file next to the output and only replaces the output
+    when it differs, so regenerating an unchanged file keeps its mtime and triggers no rebuild
+    balanceBySize spreads generated content over a fixed number of translation units and
+    writeOutputList records the generated files for the build system
+    writePrelude emits the common prelude header that replaces the repeated includes of stubs
+    and tests when the generators are given a prelude, it is written once by the main of a run
+    and the generators are only given its path
+    GeneratorStats times the read, match, emit and write phases of a run for --stats and
+    generator_benchmark.py, write covers opening, flushing and replacing the output files
+    EmitTemplate splits a template into literal text and fields once, so a declaration is rendered
+    in one pass instead of a chain of replace, and EmitSpool keeps the rendered sections that are written after the parts
+    collected while emitting them, in memory up to SPOOL_SIZE and in a temporary file beyond,
+    so the memory of a run does not grow with the size of its output
+'''
+
+import sys
+import os
+import filecmp
+import contextlib
+import time
+import resource
+import re
+import tempfile
+
+# union of the includes of gtest_generator and stub_generator, heaviest first
+PRELUDE_INCLUDE_FILES = ["gmock/gmock.h",
+                         "gtest/gtest.h",
+                         "stub.h",
+                         "memory",
+                         "tuple"]
+
+# an include guard rather than #pragma once, which gcc warns about when precompiling the header
+PRELUDE_TEMPLATE = (
+    "// common prelude of generated stubs and tests, it is the first include of every generated source\n"
+    "// and only includes headers that do not depend on the file under test, so it can be precompiled\n"
+    "#ifndef __UNITTEST_PRELUDE_H__\n"
+    "#define __UNITTEST_PRELUDE_H__\n\n"
+)
+
+PRELUDE_END_TEMPLATE = (
+    "\n#endif\n"
+)
+
+PHASES = ["read", "match", "emit", "write"]
+
+# output files are written through one large buffer rather than a system call per few lines
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+SPOOL_SIZE = 4 << 20
+
+EMIT_CHUNK_SIZE = 64 << 10
+
+class OutputFile:
+    # set by GeneratorStats.emitting while the generators run
+    stats = None
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.temp_file_name = "{}.{}.tmp".format(file_name, os.getpid())
+        self.file = None
+        self.changed = False
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.file = open(self.temp_file_name, 'w', buffering=OUTPUT_BUFFER_SIZE)
+        if OutputFile.stats is not None:
+            OutputFile.stats.seconds["write"] += time.perf_counter() - start
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if OutputFile.stats is not None:
+            with OutputFile.stats.phase("write"):
+                return self.commit(exc_type)
+        return self.commit(exc_type)
+
+    def commit(self, exc_type):
+        self.file.close()
+        if exc_type is not None:
+            os.remove(self.temp_file_name)
+            return False
+        if os.path.exists(self.file_name) and filecmp.cmp(self.temp_file_name, self.file_name, shallow=False):
+            os.remove(self.temp_file_name)
+        else:
+            os.replace(self.temp_file_name, self.file_name)
+            self.changed = True
+        return False
+
+class EmitTemplate:
+    def __init__(self, template, fields):
+        # split once into literal text at even and field names at odd positions, a render joins them in one pass
+        # the longest field first, e.g. Template_Test_Suite is not Template_Test followed by _Suite
+        pattern = re.compile("(" + "|".join(re.escape(field) for field in sorted(fields, key=len, reverse=True)) + ")")
+        self.parts = pattern.split(template)
+        self.fields = self.parts[1::2]
+
+    def render(self, **values):
+        parts = self.parts[:]
+        parts[1::2] = [values[field] for field in self.fields]
+        return "".join(parts)
+
+class EmitSpool:
+    def __init__(self, max_size=SPOOL_SIZE):
+        self.file = tempfile.SpooledTemporaryFile(max_size)
+        # sections are written to the spool a chunk at a time
+        self.pending = []
+        self.pending_size = 0
+        self.offsets = []
+        self.sizes = []
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, text):
+        # returns the index of the section, its size is in bytes as written to the spool
+        size = len(text) if text.isascii() else len(text.encode())
+        self.pending.append(text)
+        self.pending_size += size
+        self.offsets.append(self.size)
+        self.sizes.append(size)
+        self.size += size
+        if self.pending_size >= EMIT_CHUNK_SIZE:
+            self.flush()
+        return len(self.sizes) - 1
+
+    def flush(self):
+        self.file.seek(0, os.SEEK_END)
+        self.file.write("".join(self.pending).encode())
+        self.pending = []
+        self.pending_size = 0
+
+    def writeTo(self, output, indexes=None):
+        # adjacent sections are read and decoded together, a section is never split
+        self.flush()
+        if indexes is None:
+            indexes = range(len(self.sizes))
+        start = end = None
+        for index in indexes:
+            if start is not None and self.offsets[index] == end and end - start < EMIT_CHUNK_SIZE:
+                end += self.sizes[index]
+                continue
+            if start is not None:
+                self.copyTo(output, start, end)
+            start = self.offsets[index]
+            end = start + self.sizes[index]
+        if start is not None:
+            self.copyTo(output, start, end)
+
+    def copyTo(self, output, start, end):
+        self.file.seek(start)
+        output.write(self.file.read(end - start).decode())
+
+    def close(self):
+        self.file.close()
+
+def peakRss():
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+class GeneratorStats:
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.headers = 0
+        self.lines = 0
+        self.peak_rss = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def emitting(self):
+        # the time OutputFile spends writing is taken out of emit
+        write_seconds = self.seconds["write"]
+        OutputFile.stats = self
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            OutputFile.stats = None
+            self.seconds["emit"] += time.perf_counter() - start - (self.seconds["write"] - write_seconds)
+
+    def add(self, report):
+        # merges the report of another process, e.g. a batch worker
+        for phase in PHASES:
+            self.seconds[phase] += report["seconds"][phase]
+        self.headers += report["headers"]
+        self.lines += report["lines"]
+        self.peak_rss = max(self.peak_rss, report["peak_rss"])
+
+    def report(self):
+        total = sum(self.seconds.values())
+        return {"seconds": dict(self.seconds),
+                "total_seconds": total,
+                "headers": self.headers,
+                "lines": self.lines,
+                "lines_per_s": self.lines / total if total > 0 else 0,
+                "peak_rss": max(self.peak_rss, peakRss())}
+
+def balanceBySize(sizes, count):
+    # largest first into the smallest bin, each bin keeps the original order of its items
+    bins = [[] for i in range(count)]
+    totals = [0] * count
+    for index in sorted(range(len(sizes)), key=lambda index: -sizes[index]):
+        smallest = totals.index(min(totals))
+        bins[smallest].append(index)
+        totals[smallest] += sizes[index]
+    return [sorted(indexes) for indexes in bins]
+
+def writeOutputList(file_name, outputs):
+    # one path per line, e.g. for cmake file(STRINGS)
+    with OutputFile(file_name) as output_file:
+        for output in outputs:
+            output_file.write(output + "\n")
+
+def preludeInclude(prelude, output):
+    # the prelude is included by its path relative to the including file
+    return "#include \"" + os.path.relpath(prelude, os.path.dirname(os.path.abspath(output))).replace("\\", "/") + "\"\n"
+
+def writePrelude(prelude):
+    os.makedirs(os.path.dirname(prelude) or ".", exist_ok=True)
+    with OutputFile(prelude) as output_file:
+        output_file.write(PRELUDE_TEMPLATE)
+        for file_name in PRELUDE_INCLUDE_FILES:
+            output_file.write("#include <" + file_name + ">\n")
+        output_file.write(PRELUDE_END_TEMPLATE)
@@ -1,312 +1,610 @@
-'''
-    Create gtest unittest file according to header file
-    Known issues:
-    1. If there is a function implementation in the header file, this script may treat the "};" at the end of function as the end of a class in mistake
-    2. Cannot construct class that has not public constructer correctly, e.g. singlton
-    3. Cannot analysis default parameter ('=' in the args list)
-    4. fail to analysis nested namespace
-'''
-
-import sys
-import getopt
-import os
-import re
-from enum import Enum
-
-DEFAULT_TEST_OUTPUT_FILE_PREFIX = "test_"
-
-AVAILABLE_HEADER_FILE_SUFFIX_LIST = [".h"]
-
-COMMON_INCLUDE_FILES = ["stub.h",
-                        "gtest/gtest.h",
-                        "gmock/gmock.h"]
-
-TEST_SUITE_TEMPLATE = (
-    "class Template : public ::testing::Test\n"
-    "{\n"
-    "    virtual void SetUp() override\n"
-    "    {\n"
-    "        Test::SetUp();\n"
-    "    }\n"
-    "    virtual void TearDown() override\n"
-    "    {\n"
-    "        Test::TearDown();\n"
-    "    }\n"
-    "    static void SetUpTestCase()\n"
-    "    {\n"
-    "    }\n"
-    "    static void TearDownTestCase()\n"
-    "    {\n"
-    "    }\n"
-    "};\n"
-)
-
-TEST_FUNC_TEMPLATE = (
-    "\nTEST_F(Template_Test_Suite, Template_Test_Func)\n"
-    "{\n"
-    "Template_args"
-    "Template_construct"
-    "Template_Test"
-    "}\n"
-)
-
-PRE_LINE_PENDING = "    "
-
-class ParseState(Enum):
-    GLOBAL = 1 << 0
-    CLASS = 1 << 1
-    CLASS_WITHOUT_CONSTRUCTER = 1 << 2
-    CONSTRUCTER = 1 << 3
-    FUNCTION = 1 << 4
-
-class ClassAccessControl(Enum):
-    PRIVATE = 1
-    PUBLIC = 2
-
-class GtestGenerator:
-    def __init__(self, input, output, access_control):
-        self.input_file_name = input
-        self.input_file = None
-        self.output_file_name = output
-        self.output_file = None
-        self.access_control = access_control
-        self.class_name = None
-        self.class_construct_args = None
-        self.class_consturct_str = None
-        self.test_suite_name = None
-        self.cur_access_state = None
-        self.cur_parse_state = 0
-        self.cur_func_name = None
-        self.cur_func_args = None
-        self.include = ""
-        self.namespace = ""
-        self.test_suite = ""
-        self.test_case = ""
-
-    def initializeGtestFile(self):
-        for file_name in COMMON_INCLUDE_FILES:
-            self.include += ("#include <" + file_name + ">\n")
-
-        self.include += ("#include \"" + self.input_file_name.rpartition("/")[2].rpartition("\\")[2] + "\"\n")
-        self.namespace += "using namespace ::testing;\n"
-        self.test_suite += TEST_SUITE_TEMPLATE.replace("Template", self.test_suite_name)
-
-    def finalizeGtestFile(self):
-        self.output_file.write(self.include + "\n")
-        self.output_file.write(self.namespace + "\n")
-        self.output_file.write(self.test_suite + "\n")
-        self.output_file.write(self.test_case)
-
-    def checkAccessControl(self):
-        return self.access_control != True or (not self.cur_parse_state & ParseState.CLASS.value) or self.cur_access_state == ClassAccessControl.PUBLIC
-
-    def enterClass(self):
-        self.class_consturct_str = PRE_LINE_PENDING + self.class_name + " testInstance;\n"
-        self.cur_access_state = ClassAccessControl.PRIVATE
-        self.cur_parse_state |= ParseState.CLASS.value
-        self.cur_parse_state |= ParseState.CLASS_WITHOUT_CONSTRUCTER.value
-
-    def leaveClass(self):
-        self.cur_access_state = None
-        self.cur_parse_state &= ~ParseState.CLASS.value
-        self.cur_parse_state &= ~ParseState.CLASS_WITHOUT_CONSTRUCTER.value
-        self.class_name = None
-        self.class_construct_args = None
-        self.class_consturct_str = None
-
-    #TODO: generate default parameter
-    @staticmethod
-    def generateTestArgs(func_args_str, arg_prefix):
-        if func_args_str is None:
-            return [["", ""]]
-        i = 0
-        args_cons_str = ""
-        args_str = ""
-        args = func_args_str.split(",")
-        for arg in args:
-            argv = re.search(r"(const\s*)*([^\*&]+)([\s\*&\)]+)\S*$", arg.strip())
-            if argv is None:
-                continue
-            arg_type = argv.group(2).strip()
-            pointer_or_ref = argv.group(3).strip()
-            if arg_type == "void" and (pointer_or_ref is None or pointer_or_ref == ""):
-                continue
-            if pointer_or_ref is not None and pointer_or_ref == "*":
-                args_cons_str += PRE_LINE_PENDING + "{}* {}{} = nullptr;\n".format(arg_type, arg_prefix, str(i))
-            else:
-                args_cons_str += PRE_LINE_PENDING + "{} {}{};\n".format(arg_type, arg_prefix, str(i))
-            args_str += arg_prefix + str(i) + ", "
-            i += 1
-        args_str = args_str.rstrip(", ")
-        return [[args_cons_str, args_str]]
-
-    def parseConstructer(self):
-        if self.cur_parse_state & ParseState.CLASS_WITHOUT_CONSTRUCTER.value:
-            args_str_list = self.generateTestArgs(self.class_construct_args, "construct_arg")
-            args_cons_str, args_str = args_str_list[0]
-            self.class_consturct_str = args_cons_str
-            self.class_consturct_str += PRE_LINE_PENDING + self.class_name + " testInstance{" + args_str + "};\n"
-        self.cur_parse_state &= ~ParseState.CONSTRUCTER.value
-        self.cur_parse_state &= ~ParseState.CLASS_WITHOUT_CONSTRUCTER.value
-
-    def parseFunction(self):
-        #parse arguments
-        i = 0
-        args_str_list = self.generateTestArgs(self.cur_func_args, "arg")
-        for args_cons_str, args_str in args_str_list:
-            result = TEST_FUNC_TEMPLATE.replace("Template_Test_Suite", self.test_suite_name).replace("Template_Test_Func", self.cur_func_name + str(i)).replace("Template_args", args_cons_str)
-            if self.cur_parse_state & ParseState.CLASS.value:
-                result = result.replace("Template_construct", self.class_consturct_str).replace("Template_Test", PRE_LINE_PENDING + "testInstance.{}({});\n".format(self.cur_func_name, args_str))
-            else:
-                result = result.replace("Template_construct", "").replace("Template_Test", PRE_LINE_PENDING + "{}({});\n".format(self.cur_func_name, args_str))
-            self.test_case += result
-            i += 1
-
-        self.cur_func_name = None
-        self.cur_func_args = None
-        self.cur_parse_state &= ~ParseState.FUNCTION.value
-
-    def run(self):
-        with open(self.input_file_name, 'r') as self.input_file:
-            with open(self.output_file_name, 'w') as self.output_file:
-                self.test_suite_name = re.search(r"(\w+).\w+", self.input_file_name.rpartition("/")[2].rpartition("\\")[2]).group(1) + "Test"
-                self.initializeGtestFile()
-
-                lines = self.input_file.readlines()
-                for line in lines:
-                    #annotation
-                    if line.strip().startswith("//"):
-                        continue
-
-                    #parse namespace
-                    namespace_line = re.search(r"\s*namespace\s+([\S]+)$", line)
-                    if namespace_line is not None:
-                        self.namespace += ("using namespace " + namespace_line.group(1) + ";\n")
-                        continue
-
-                    #parse class name
-                    class_line = re.search(r"\s*class\s+([a-zA-Z]+)([^;]*$)", line)
-                    if class_line is not None:
-                        self.class_name = class_line.group(1)
-                        if "}" not in class_line.group(2):
-                            self.enterClass()
-                        continue
-
-                    #parse constructer (only call the first constructer if there are more than one)
-                    if self.cur_parse_state & ParseState.CLASS.value:
-                        constructer_line = re.search(r"\s*[^~]" + self.class_name + r"\s*\(([^\)]*)(\)\s*;)*", line)
-                        if constructer_line is not None:
-                            self.cur_parse_state |= ParseState.CONSTRUCTER.value
-                            self.class_construct_args = constructer_line.group(1)
-                            constructer_end = constructer_line.group(2)
-                            if constructer_end is not None:
-                                self.parseConstructer()
-                            continue
-
-                    #parse constructer args
-                    if self.cur_parse_state & ParseState.CONSTRUCTER.value:
-                        args_line = re.search(r"([^\)]*)\s*(\)\s*;)*", line)
-                        if args_line is not None:
-                            args = args_line.group(1).strip()
-                            args_end = args_line.group(2)
-                            if args is not None:
-                                self.class_construct_args += args
-                            if args_end is not None:
-                                self.parseConstructer()
-                            continue
-
-                    #TODO: treat "};" as the end of class in mistake, even if it just the end of a function implementation
-                    #parse function
-                    function_line = re.search(r"[\w\s]*(\w[\w\s\*&]+)\s+(\w+)\s*\(([^\)]*)(\)\s*;)*", line)
-                    if function_line is not None:
-                        self.cur_parse_state |= ParseState.FUNCTION.value
-                        self.cur_func_name = function_line.group(2)
-                        self.cur_func_args = function_line.group(3)
-                        function_end = function_line.group(4)
-                        if function_end is not None:
-                            if self.checkAccessControl() == True:
-                                self.parseFunction()
-                            else:
-                                self.cur_func_name = None
-                                self.cur_func_args = None
-                                self.cur_parse_state &= ~ParseState.FUNCTION.value
-                        if (self.cur_parse_state & ParseState.CLASS.value) and "};" in line:
-                            self.leaveClass()
-                        continue
-
-                    #parse function args
-                    if self.cur_parse_state & ParseState.FUNCTION.value:
-                        args_line = re.search(r"([^\)]*)\s*(\)\s*;)*", line)
-                        if args_line is not None:
-                            args = args_line.group(1).strip()
-                            args_end = args_line.group(2)
-                            if args is not None:
-                                self.cur_func_args += args
-                            if args_end is not None and self.checkAccessControl() == True:
-                                self.parseFunction()
-                        if (self.cur_parse_state & ParseState.CLASS.value) and "};" in line:
-                            self.leaveClass()
-                        continue
-
-                    #parse access control
-                    access_control_line = re.search(r"\s*(public:|private:|protected:)\s*", line)
-                    if access_control_line is not None:
-                        if "public:" == access_control_line.group(1):
-                            self.cur_access_state = ClassAccessControl.PUBLIC
-                        else:
-                            self.cur_access_state = ClassAccessControl.PRIVATE
-                        continue
-
-                    #level class
-                    if (self.cur_parse_state & ParseState.CLASS.value) and "};" in line:
-                        self.leaveClass()
-                        continue
-
-                self.finalizeGtestFile()
-
-def checkHeadFile(input):
-    if os.path.exists(input) == False:
-        return False
-    for suffix in AVAILABLE_HEADER_FILE_SUFFIX_LIST:
-        if input.endswith(suffix) == True:
-            return True
-    return False
-
-def generateGtest(input, output, access_control):
-    generator = GtestGenerator(input, output, access_control)
-    generator.run()
-
-def main(argv):
-    try:
-        opts, args = getopt.getopt(argv, "hi:o", ["no-access-control"])
-    except getopt.GetoptError:
-        print("usage -i <input_file> -o <output_file>")
-        sys.exit(2)
-
-    input = None
-    output = None
-    access_control = True
-
-    for opt, arg in opts:
-        if opt == "-h":
-            print("usage -i <input_file> -o <output_file>")
-            sys.exit()
-        elif opt == "-i":
-            input = arg
-        elif opt == "-o":
-            output = arg
-        elif opt == "--no-access-control":
-            access_control = False
-    
-    if input is None or checkHeadFile(input) == False:
-        print("invalid input")
-        sys.exit(2)
-    
-    if output is None:
-        output = DEFAULT_TEST_OUTPUT_FILE_PREFIX + input.rpartition(".")[0].rpartition("/")[2].rpartition("\\")[2] + ".cpp"
-    
-    print("input: {}, output: {}".format(input, output))
-    generateGtest(input, output, access_control)
-
-if __name__ == "__main__":
+'''
+    Create gtest unittest file according to header file
+    The header is parsed by cpp_header_parser
+    With --parameterized, the functions of a class (or the free functions) are tested by TEST_P on one
+    fixture, the fixture unpacks a pool of arguments from GetParam(), takes a singleton argument from its
+    accessor and holds the instance under test,
+    and one INSTANTIATE_TEST_SUITE_P per fixture gives its data table, so a test body is only the call
+    under test. The table has one row of value initialized arguments, so every function is called once
+    as in the TEST_F output, only with initialized rather than indeterminate arguments
+    With --shards N, the fixture goes to a shared header and the test cases are balanced by size
+    over N shard sources, --output-list writes the generated files for the build system
+    With --fixture-instance test, the instance under test and its constructor arguments are members of
+    a fixture per class and it is constructed in SetUp, with --fixture-instance suite it is constructed
+    once in SetUpTestCase and shared by all tests of the class, so tests shall not depend on its state
+    With --prelude, the common includes are replaced by a shared prelude header, see generator_output.py
+    Given a unit name, e.g. by the --unity batch of unittest_generator.py, the test suite is named after it
+    and everything but the includes is wrapped in its own namespace, so that the test sources of a unity
+    source neither redefine each other's fixtures nor see each other's using directives, the header is
+    then included by the given include name, e.g. its path below the root, rather than its base name
+    Type facts of the header drive the arguments and the instance under test, pointer typedefs are
+    initialized to nullptr, a singleton is taken from its static accessor and a test that needs a value
+    of an incomplete or unconstructible type is emitted with a GTEST_SKIP() body. With -I, the facts of the included headers are
+    added, see include_graph.py
+    Every test is rendered by one precompiled template and spooled until the output is written,
+    see EmitTemplate and EmitSpool in generator_output.py
+    Known issues:
+    1. Tests of a class that has not public constructer are skipped unless it has a static accessor
+'''
+
+import sys
+import getopt
+import os
+import re
+from cpp_header_parser import ClassAccessControl, DeclarationKind, Argument, parseHeaderModel
+from header_model_cache import loadHeaderModel
+from include_graph import TypeFacts, sharedIncludeGraph
+from generator_output import OutputFile, EmitTemplate, EmitSpool, balanceBySize, writeOutputList, preludeInclude, writePrelude
+
+DEFAULT_TEST_OUTPUT_FILE_PREFIX = "test_"
+
+AVAILABLE_HEADER_FILE_SUFFIX_LIST = [".h"]
+
+COMMON_INCLUDE_FILES = ["stub.h",
+                        "gtest/gtest.h",
+                        "gmock/gmock.h"]
+
+TEST_SUITE_TEMPLATE = (
+    "class Template : public ::testing::Test\n"
+    "{\n"
+    "protected:\n"
+    "    virtual void SetUp() override\n"
+    "    {\n"
+    "        Test::SetUp();\n"
+    "    }\n"
+    "    virtual void TearDown() override\n"
+    "    {\n"
+    "        Test::TearDown();\n"
+    "    }\n"
+    "    static void SetUpTestCase()\n"
+    "    {\n"
+    "    }\n"
+    "    static void TearDownTestCase()\n"
+    "    {\n"
+    "    }\n"
+    "};\n"
+)
+
+TEST_FUNC_TEMPLATE = (
+    "\nTEST_F(Template_Test_Suite, Template_Test_Func)\n"
+    "{\n"
+    "Template_args"
+    "Template_construct"
+    "Template_Test"
+    "}\n"
+)
+
+#the members are initialized in declaration order, the arguments first and the instance under test last
+TEST_PARAM_SUITE_TEMPLATE = (
+    "\nclass Template_Param_Suite : public Template_Test_Suite, public ::testing::WithParamInterface<std::tuple<Template_types>>\n"
+    "{\n"
+    "protected:\n"
+    "Template_args"
+    "Template_construct"
+    "};\n"
+)
+
+TEST_PARAM_TEMPLATE = (
+    "\nTEST_P(Template_Param_Suite, Template_Test_Func)\n"
+    "{\n"
+    "Template_Test"
+    "}\n"
+)
+
+#emitted as a test case of its own, so that a fixture is instantiated once even in shards,
+#the one row is the value-initialized tuple, nullptr, false or 0 for builtin types and T{} for the rest
+TEST_PARAM_INSTANTIATE_TEMPLATE = (
+    "\nINSTANTIATE_TEST_SUITE_P(Values, Template_Param_Suite, ::testing::Values(Template_Param_Suite::ParamType()));\n"
+)
+
+#a test whose arguments or instance cannot be built is skipped rather than given a null reference
+TEST_SKIP_TEMPLATE = (
+    "\nTEST_F(Template_Test_Suite, Template_Test_Func)\n"
+    "{\n"
+    "    GTEST_SKIP() << \"Template_reason\";\n"
+    "}\n"
+)
+
+PARAM_INCLUDE_FILES = ["tuple"]
+
+TEST_CLASS_FIXTURE_TEMPLATE = (
+    "\nclass Template_Class_Suite : public Template_Test_Suite\n"
+    "{\n"
+    "protected:\n"
+    "    virtual void SetUp() override\n"
+    "    {\n"
+    "        Template_Test_Suite::SetUp();\n"
+    "        testInstance.reset(new Template_Class{Template_construct_args});\n"
+    "    }\n"
+    "    virtual void TearDown() override\n"
+    "    {\n"
+    "        testInstance.reset();\n"
+    "        Template_Test_Suite::TearDown();\n"
+    "    }\n"
+    "Template_construct_members"
+    "    std::unique_ptr<Template_Class> testInstance;\n"
+    "};\n"
+)
+
+#the shared instance lives in a function local static, so the fixture can be defined in the header of shards
+TEST_SHARED_INSTANCE_TEMPLATE = (
+    "    static void SetUpTestCase()\n"
+    "    {\n"
+    "        Template_Test_Suite::SetUpTestCase();\n"
+    "Template_construct_members"
+    "        sharedInstance().reset(new Template_Class{Template_construct_args});\n"
+    "    }\n"
+    "    static void TearDownTestCase()\n"
+    "    {\n"
+    "        sharedInstance().reset();\n"
+    "        Template_Test_Suite::TearDownTestCase();\n"
+    "    }\n"
+    "    virtual void SetUp() override\n"
+    "    {\n"
+    "        Template_Test_Suite::SetUp();\n"
+    "        testInstance = sharedInstance().get();\n"
+    "    }\n"
+    "    static std::unique_ptr<Template_Class>& sharedInstance()\n"
+    "    {\n"
+    "        static std::unique_ptr<Template_Class> instance;\n"
+    "        return instance;\n"
+    "    }\n"
+    "    Template_Class* testInstance = nullptr;\n"
+)
+
+TEST_SHARED_CLASS_FIXTURE_TEMPLATE = (
+    "\nclass Template_Class_Suite : public Template_Test_Suite\n"
+    "{\n"
+    "protected:\n"
+    + TEST_SHARED_INSTANCE_TEMPLATE +
+    "};\n"
+)
+
+TEST_SUITE = EmitTemplate(TEST_SUITE_TEMPLATE, ["Template"])
+
+TEST_FUNC = EmitTemplate(TEST_FUNC_TEMPLATE, ["Template_Test_Suite", "Template_Test_Func", "Template_args", "Template_construct", "Template_Test"])
+
+TEST_SKIP = EmitTemplate(TEST_SKIP_TEMPLATE, ["Template_Test_Suite", "Template_Test_Func", "Template_reason"])
+
+TEST_PARAM_SUITE = EmitTemplate(TEST_PARAM_SUITE_TEMPLATE, ["Template_Param_Suite", "Template_Test_Suite", "Template_types", "Template_args",
+                                                            "Template_construct"])
+
+TEST_PARAM = EmitTemplate(TEST_PARAM_TEMPLATE, ["Template_Param_Suite", "Template_Test_Func", "Template_Test"])
+
+TEST_PARAM_INSTANTIATE = EmitTemplate(TEST_PARAM_INSTANTIATE_TEMPLATE, ["Template_Param_Suite"])
+
+TEST_CLASS_FIXTURE = EmitTemplate(TEST_CLASS_FIXTURE_TEMPLATE, ["Template_Class_Suite", "Template_Test_Suite", "Template_Class",
+                                                                "Template_construct_members", "Template_construct_args"])
+
+TEST_SHARED_INSTANCE = EmitTemplate(TEST_SHARED_INSTANCE_TEMPLATE, ["Template_Test_Suite", "Template_Class", "Template_construct_members",
+                                                                    "Template_construct_args"])
+
+TEST_SHARED_CLASS_FIXTURE = EmitTemplate(TEST_SHARED_CLASS_FIXTURE_TEMPLATE, ["Template_Class_Suite", "Template_Test_Suite", "Template_Class",
+                                                                              "Template_construct_members", "Template_construct_args"])
+
+FIXTURE_INSTANCE_TEST = "test"
+FIXTURE_INSTANCE_SUITE = "suite"
+
+FIXTURE_INCLUDE_FILES = ["memory"]
+
+PRE_LINE_PENDING = "    "
+
+USAGE = ("usage -i <input_file> -o <output_file> --model-cache <cache_dir> --parameterized\n"
+         "      --shards <count> --output-list <list_file> --prelude <prelude_header>\n"
+         "      --fixture-instance <test|suite> -I <include_path>")
+
+class GtestGenerator:
+    def __init__(self, input, output, access_control, parameterized=False, shards=1, prelude=None, fixture_instance=None, type_facts=None,
+                 unit_name=None, include_name=None):
+        self.input_file_name = input
+        self.output_file_name = output
+        self.output_file = None
+        self.access_control = access_control
+        self.parameterized = parameterized
+        self.shards = shards
+        self.prelude = prelude
+        self.fixture_instance = fixture_instance
+        self.type_facts = type_facts
+        self.unit_name = unit_name
+        self.include_name = include_name if include_name is not None else input.rpartition("/")[2].rpartition("\\")[2]
+        self.output_files = []
+        self.class_name = None
+        self.class_consturct_str = None
+        self.class_has_constructer = False
+        self.class_construct_args = None
+        self.class_skip_reason = None
+        self.outer_classes = []
+        self.test_suite_name = None
+        self.include = ""
+        self.namespace = ""
+        self.test_suite = ""
+        self.unit_begin = ""
+        self.unit_end = ""
+        # fixtures and test cases are spooled while the namespaces ahead of them are still collected
+        self.class_fixtures = None
+        self.class_fixture_names = set()
+        # the parameterized fixture, its argument pool and test names per class and construction
+        self.param_suites = {}
+        self.test_cases = None
+
+    def initializeGtestFile(self):
+        if self.prelude is not None:
+            # the fixture header of shards is next to the test output
+            self.include += preludeInclude(self.prelude, self.output_file_name)
+        else:
+            for file_name in COMMON_INCLUDE_FILES:
+                self.include += ("#include <" + file_name + ">\n")
+        if self.parameterized == True and self.prelude is None:
+            for file_name in PARAM_INCLUDE_FILES:
+                self.include += ("#include <" + file_name + ">\n")
+        if self.fixture_instance is not None and self.prelude is None:
+            for file_name in FIXTURE_INCLUDE_FILES:
+                self.include += ("#include <" + file_name + ">\n")
+
+        self.include += ("#include \"" + self.include_name + "\"\n")
+        self.namespace += "using namespace ::testing;\n"
+        self.test_suite += TEST_SUITE.render(Template=self.test_suite_name)
+        # the using directives, fixtures and tests of a unit are kept out of the other sources of a unity build
+        if self.unit_name is not None:
+            self.unit_begin = "namespace " + self.unit_name + "_unit\n{\n"
+            self.unit_end = "}\n"
+
+    def finalizeGtestFile(self):
+        if self.shards > 1:
+            self.finalizeShardFiles()
+            return
+        with OutputFile(self.output_file_name) as self.output_file:
+            self.output_file.write(self.include + "\n")
+            self.output_file.write(self.unit_begin)
+            self.output_file.write(self.namespace + "\n")
+            self.output_file.write(self.test_suite)
+            self.class_fixtures.writeTo(self.output_file)
+            self.output_file.write("\n")
+            self.test_cases.writeTo(self.output_file)
+            self.output_file.write(self.unit_end)
+        self.output_files = [self.output_file_name]
+
+    def finalizeShardFiles(self):
+        fixture_header, shard_sources = gtestShardOutputs(self.output_file_name, self.shards)
+        with OutputFile(fixture_header) as self.output_file:
+            self.output_file.write("#pragma once\n\n")
+            self.output_file.write(self.include + "\n")
+            self.output_file.write(self.unit_begin)
+            self.output_file.write(self.namespace + "\n")
+            self.output_file.write(self.test_suite)
+            self.class_fixtures.writeTo(self.output_file)
+            self.output_file.write(self.unit_end)
+        # a precompiled prelude is only used when it is the first include of the source
+        shard_include = preludeInclude(self.prelude, shard_sources[0]) if self.prelude is not None else ""
+        shard_include += "#include \"" + fixture_header.rpartition("/")[2].rpartition("\\")[2] + "\"\n"
+        shard_cases = balanceBySize(self.test_cases.sizes, self.shards)
+        for shard_source, indexes in zip(shard_sources, shard_cases):
+            with OutputFile(shard_source) as self.output_file:
+                self.output_file.write(shard_include)
+                self.output_file.write(self.unit_begin)
+                self.test_cases.writeTo(self.output_file, indexes)
+                self.output_file.write(self.unit_end)
+        self.output_files = [fixture_header] + shard_sources
+
+    def checkAccessControl(self, declaration):
+        return self.access_control != True or declaration.class_name is None or declaration.access == ClassAccessControl.PUBLIC
+
+    def enterNamespace(self, declaration):
+        if declaration.name is not None:
+            self.namespace += ("using namespace " + declaration.qualified_name + ";\n")
+
+    def enterClass(self, declaration):
+        self.outer_classes.append((self.class_name, self.class_consturct_str, self.class_has_constructer, self.class_construct_args,
+                                   self.class_skip_reason))
+        self.class_name = declaration.class_name
+        self.class_skip_reason = None
+        self.class_consturct_str = PRE_LINE_PENDING + self.class_name + " testInstance;\n"
+        self.class_has_constructer = False
+        self.class_construct_args = ["", ""]
+        accessor = self.type_facts.instanceAccessor(self.class_name)
+        if accessor is not None:
+            # e.g. a singleton, its constructers are never called
+            self.class_consturct_str = PRE_LINE_PENDING + self.class_name + "& testInstance = " + accessor + ";\n"
+            self.class_has_constructer = True
+        elif self.type_facts.isUnconstructible(self.class_name):
+            self.class_skip_reason = "{} has not public constructer".format(self.class_name)
+            self.class_has_constructer = True
+
+    def leaveClass(self):
+        self.class_name, self.class_consturct_str, self.class_has_constructer, self.class_construct_args, self.class_skip_reason = self.outer_classes.pop()
+
+    #TODO: generate default parameter
+    @staticmethod
+    def generateTestArgs(func_args, arg_prefix, type_facts=None):
+        if type_facts is None:
+            type_facts = TypeFacts()
+        if func_args is None:
+            return [["", ""]]
+        # lines and names are joined once, rather than concatenated per argument
+        args_cons = []
+        args = []
+        for arg in func_args:
+            if arg.type == "...":
+                continue
+            arg_type = GtestGenerator.testArgType(arg)
+            arg_name = arg_prefix + str(len(args))
+            if arg_type.endswith("*") or arg_type.endswith(")") or type_facts.isPointer(arg_type):
+                args_cons.append(PRE_LINE_PENDING + Argument(arg_type, arg_name).declaration() + " = nullptr;\n")
+            elif type_facts.instanceAccessor(arg_type) is not None:
+                args_cons.append(PRE_LINE_PENDING + Argument(arg_type + "&", arg_name).declaration() + " = " + type_facts.instanceAccessor(arg_type) + ";\n")
+            else:
+                args_cons.append(PRE_LINE_PENDING + Argument(arg_type, arg_name).declaration() + ";\n")
+            args.append(arg_name)
+        return [["".join(args_cons), ", ".join(args)]]
+
+    #the reason to skip a test of func_args, or None when every argument can be built
+    @staticmethod
+    def unconstructibleReason(func_args, type_facts):
+        for arg in func_args or []:
+            arg_type = GtestGenerator.testArgType(arg)
+            if arg.type != "..." and type_facts.isUnconstructible(arg_type) and type_facts.instanceAccessor(arg_type) is None:
+                return "no instance of {} can be constructed".format(arg_type)
+        return None
+
+    @staticmethod
+    def testArgType(arg):
+        arg_type = arg.type
+        if arg_type.startswith("const "):
+            arg_type = arg_type[6:]
+        return arg_type.rstrip("&")
+
+    #only call the first public constructer if there are more than one
+    def parseConstructer(self, declaration):
+        if declaration.access != ClassAccessControl.PUBLIC:
+            return
+        if self.class_has_constructer == False:
+            reason = self.unconstructibleReason(declaration.args, self.type_facts)
+            if reason is not None:
+                self.class_skip_reason = "{} cannot be constructed, {}".format(self.class_name, reason)
+            args_str_list = self.generateTestArgs(declaration.args, "construct_arg", self.type_facts)
+            args_cons_str, args_str = args_str_list[0]
+            self.class_construct_args = args_str_list[0]
+            self.class_consturct_str = args_cons_str
+            self.class_consturct_str += PRE_LINE_PENDING + self.class_name + " testInstance{" + args_str + "};\n"
+        self.class_has_constructer = True
+
+    #static locals, so that arguments passed by reference outlive the construction of a shared instance
+    @staticmethod
+    def staticConstructArgs(args_cons_str):
+        return "".join(PRE_LINE_PENDING * 2 + "static " + line.lstrip() + "\n" for line in args_cons_str.splitlines())
+
+    #the fixture of a class is emitted when its first test is, with the constructer known at that point
+    def classFixture(self):
+        class_suite_name = (self.test_suite_name + "_" + self.class_name).replace("::", "_")
+        if class_suite_name in self.class_fixture_names:
+            return class_suite_name
+        args_cons_str, args_str = self.class_construct_args
+        if self.fixture_instance == FIXTURE_INSTANCE_SUITE:
+            args_cons_str = self.staticConstructArgs(args_cons_str)
+            fixture_template = TEST_SHARED_CLASS_FIXTURE
+        else:
+            fixture_template = TEST_CLASS_FIXTURE
+        self.class_fixtures.append(fixture_template.render(Template_Class_Suite=class_suite_name, Template_Test_Suite=self.test_suite_name,
+                                                           Template_Class=self.class_name, Template_construct_members=args_cons_str,
+                                                           Template_construct_args=args_str))
+        self.class_fixture_names.add(class_suite_name)
+        return class_suite_name
+
+    #returns the fixture, the construction of the instance and the call under test
+    def testTarget(self, declaration, args_str):
+        if declaration.class_name is None:
+            return self.test_suite_name, "", PRE_LINE_PENDING + "{}({});\n".format(declaration.name, args_str)
+        # a class taken from its accessor is never owned by a fixture
+        if self.fixture_instance is None or self.type_facts.instanceAccessor(self.class_name) is not None:
+            return self.test_suite_name, self.class_consturct_str, PRE_LINE_PENDING + "testInstance.{}({});\n".format(declaration.name, args_str)
+        return self.classFixture(), "", PRE_LINE_PENDING + "testInstance->{}({});\n".format(declaration.name, args_str)
+
+    #the arguments of every test on a fixture are taken from one pool of members, an argument type used
+    #n times by a function has at least n members of that type in the pool
+    def parseParamFunction(self, declaration):
+        arg_types = [self.testArgType(arg) for arg in declaration.args or [] if arg.type != "..."]
+        construct_str = self.paramInstanceMembers(declaration)
+        key = (declaration.class_name, construct_str)
+        if key not in self.param_suites:
+            param_suite_name = (self.test_suite_name + ("_" + declaration.class_name if declaration.class_name is not None else "")).replace("::", "_")
+            self.param_suites[key] = {"name": param_suite_name + "_Param" + str(len(self.param_suites)), "construct": construct_str,
+                                      "types": [], "tests": set()}
+        param_suite = self.param_suites[key]
+        args = []
+        for arg_type in arg_types:
+            members = [i for i, member_type in enumerate(param_suite["types"]) if member_type == arg_type]
+            used = sum(1 for other_type in arg_types[:len(args)] if other_type == arg_type)
+            if used < len(members):
+                args.append("arg" + str(members[used]))
+            else:
+                args.append("arg" + str(len(param_suite["types"])))
+                param_suite["types"].append(arg_type)
+        # overloads share the fixture, so the test name is made unique in it
+        test_name = declaration.name
+        while test_name in param_suite["tests"]:
+            test_name = declaration.name + str(len(param_suite["tests"]))
+        param_suite["tests"].add(test_name)
+        if declaration.class_name is None:
+            test_str = PRE_LINE_PENDING + "{}({});\n".format(declaration.name, ", ".join(args))
+        elif self.fixture_instance == FIXTURE_INSTANCE_SUITE and self.type_facts.instanceAccessor(self.class_name) is None:
+            test_str = PRE_LINE_PENDING + "testInstance->{}({});\n".format(declaration.name, ", ".join(args))
+        else:
+            test_str = PRE_LINE_PENDING + "testInstance.{}({});\n".format(declaration.name, ", ".join(args))
+        self.test_cases.append(TEST_PARAM.render(Template_Param_Suite=param_suite["name"], Template_Test_Func=test_name, Template_Test=test_str))
+
+    #the members of a parameterized fixture giving the instance under test, the fixture is constructed per test,
+    #so the instance is one of its members for --fixture-instance test too, and no class fixture is needed
+    def paramInstanceMembers(self, declaration):
+        if declaration.class_name is None:
+            return ""
+        if self.fixture_instance == FIXTURE_INSTANCE_SUITE and self.type_facts.instanceAccessor(self.class_name) is None:
+            args_cons_str, args_str = self.class_construct_args
+            return TEST_SHARED_INSTANCE.render(Template_Test_Suite=self.test_suite_name, Template_Class=self.class_name,
+                                               Template_construct_members=self.staticConstructArgs(args_cons_str),
+                                               Template_construct_args=args_str)
+        return self.class_consturct_str
+
+    #the argument pools are complete once every function is seen
+    def finalizeParamSuites(self):
+        for param_suite in self.param_suites.values():
+            args_cons_str = ""
+            tuple_types = []
+            for i, arg_type in enumerate(param_suite["types"]):
+                accessor = self.type_facts.instanceAccessor(arg_type)
+                # a singleton cannot be copied into the tuple, its member refers to the instance instead
+                if accessor is not None:
+                    args_cons_str += PRE_LINE_PENDING + Argument(arg_type + "&", "arg" + str(i)).declaration() + " = " + accessor + ";\n"
+                else:
+                    args_cons_str += PRE_LINE_PENDING + Argument(arg_type, "arg" + str(i)).declaration() + " = std::get<{}>(GetParam());\n".format(len(tuple_types))
+                    tuple_types.append(arg_type)
+            types_str = ", ".join(Argument(arg_type).declaration() for arg_type in tuple_types)
+            self.class_fixtures.append(TEST_PARAM_SUITE.render(Template_Param_Suite=param_suite["name"], Template_Test_Suite=self.test_suite_name,
+                                                               Template_types=types_str, Template_args=args_cons_str,
+                                                               Template_construct=param_suite["construct"]))
+            self.test_cases.append(TEST_PARAM_INSTANTIATE.render(Template_Param_Suite=param_suite["name"]))
+
+    def parseFunction(self, declaration):
+        reason = self.class_skip_reason if declaration.class_name is not None else None
+        if reason is None:
+            reason = self.unconstructibleReason(declaration.args, self.type_facts)
+        if reason is not None:
+            self.test_cases.append(TEST_SKIP.render(Template_Test_Suite=self.test_suite_name, Template_Test_Func=declaration.name + "0",
+                                                    Template_reason=reason))
+            return
+        if self.parameterized == True:
+            self.parseParamFunction(declaration)
+            return
+        #parse arguments
+        i = 0
+        args_str_list = self.generateTestArgs(declaration.args, "arg", self.type_facts)
+        for args_cons_str, args_str in args_str_list:
+            test_suite_name, construct_str, test_str = self.testTarget(declaration, args_str)
+            self.test_cases.append(TEST_FUNC.render(Template_Test_Suite=test_suite_name, Template_Test_Func=declaration.name + str(i),
+                                                    Template_args=args_cons_str, Template_construct=construct_str, Template_Test=test_str))
+            i += 1
+
+    def run(self, model=None):
+        if model is None:
+            model = parseHeaderModel(self.input_file_name)
+        if self.type_facts is None:
+            self.type_facts = TypeFacts.fromModels([model])
+        if self.unit_name is not None:
+            self.test_suite_name = self.unit_name + "Test"
+        else:
+            self.test_suite_name = re.search(r"(\w+).\w+", self.input_file_name.rpartition("/")[2].rpartition("\\")[2]).group(1) + "Test"
+        with EmitSpool() as self.class_fixtures, EmitSpool() as self.test_cases:
+            self.initializeGtestFile()
+
+            for declaration in model.declarations:
+                if declaration.kind == DeclarationKind.NAMESPACE_BEGIN:
+                    self.enterNamespace(declaration)
+                elif declaration.kind == DeclarationKind.CLASS_BEGIN:
+                    self.enterClass(declaration)
+                elif declaration.kind == DeclarationKind.CLASS_END:
+                    self.leaveClass()
+                elif declaration.kind == DeclarationKind.CONSTRUCTER:
+                    self.parseConstructer(declaration)
+                elif declaration.kind == DeclarationKind.FUNCTION and self.checkAccessControl(declaration) == True:
+                    self.parseFunction(declaration)
+            self.finalizeParamSuites()
+
+            self.finalizeGtestFile()
+
+def checkHeadFile(input):
+    if os.path.exists(input) == False:
+        return False
+    for suffix in AVAILABLE_HEADER_FILE_SUFFIX_LIST:
+        if input.endswith(suffix) == True:
+            return True
+    return False
+
+def defaultGtestOutput(input):
+    return DEFAULT_TEST_OUTPUT_FILE_PREFIX + input.rpartition(".")[0].rpartition("/")[2].rpartition("\\")[2] + ".cpp"
+
+def gtestShardOutputs(output, shards):
+    base = output.rpartition(".")[0]
+    return base + ".h", ["{}_shard{}.cpp".format(base, i) for i in range(shards)]
+
+def generateGtest(input, output, access_control, model=None, parameterized=False, shards=1, prelude=None, fixture_instance=None,
+                  include_paths=None, model_cache_dir=None, unit_name=None, include_name=None):
+    if model is None:
+        model = parseHeaderModel(input)
+    if include_paths is not None and len(include_paths) > 0:
+        type_facts = sharedIncludeGraph(include_paths, model_cache_dir).typeFacts(input, model)
+    else:
+        type_facts = TypeFacts.fromModels([model])
+    generator = GtestGenerator(input, output, access_control, parameterized, shards, prelude, fixture_instance, type_facts, unit_name,
+                               include_name)
+    generator.run(model)
+    return generator.output_files
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hi:o:I:", ["no-access-control", "model-cache=", "parameterized", "shards=", "output-list=", "prelude=", "fixture-instance="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+
+    input = None
+    output = None
+    access_control = True
+    model_cache_dir = None
+    parameterized = False
+    shards = 1
+    output_list = None
+    prelude = None
+    fixture_instance = None
+    include_paths = []
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        elif opt == "-i":
+            input = arg
+        elif opt == "-o":
+            output = arg
+        elif opt == "--no-access-control":
+            access_control = False
+        elif opt == "--model-cache":
+            model_cache_dir = arg
+        elif opt == "--parameterized":
+            parameterized = True
+        elif opt == "--shards":
+            try:
+                shards = int(arg)
+            except ValueError:
+                shards = 0
+            if shards < 1:
+                print("shards shall be a positive number")
+                sys.exit(2)
+        elif opt == "--output-list":
+            output_list = arg
+        elif opt == "--prelude":
+            prelude = arg
+        elif opt == "--fixture-instance":
+            if arg not in (FIXTURE_INSTANCE_TEST, FIXTURE_INSTANCE_SUITE):
+                print("fixture instance shall be {} or {}".format(FIXTURE_INSTANCE_TEST, FIXTURE_INSTANCE_SUITE))
+                sys.exit(2)
+            fixture_instance = arg
+        elif opt == "-I":
+            include_paths.append(arg)
+    
+    if input is None or checkHeadFile(input) == False:
+        print("invalid input")
+        sys.exit(2)
+    
+    if output is None:
+        output = defaultGtestOutput(input)
+    
+    print("input: {}, output: {}".format(input, output))
+    if prelude is not None:
+        writePrelude(prelude)
+    model = loadHeaderModel(input, model_cache_dir) if model_cache_dir is not None else None
+    output_files = generateGtest(input, output, access_control, model, parameterized, shards, prelude, fixture_instance,
+                                 include_paths, model_cache_dir)
+    if output_list is not None:
+        writeOutputList(output_list, output_files)
+
+if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
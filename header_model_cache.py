@@ -0,0 +1,149 @@
+'''
+    Persistent cache of parsed header models shared by gtest_generator, stub_generator and unittest_generator
+    A model is pickled under the hash of the header content and the model version, so a header
+    is parsed once per change no matter how many tools or runs use it. The cache is bounded in
+    size, the least recently used entries are evicted first.
+'''
+
+import sys
+import getopt
+import os
+import hashlib
+import pickle
+import time
+import re
+from cpp_header_parser import buildHeaderModel
+from generator_output import GeneratorStats
+
+#bump when HeaderModel or the parser output changes, entries of other versions are never loaded
+MODEL_CACHE_VERSION = 5
+
+MODEL_CACHE_SUFFIX = ".pickle"
+
+# entries are named by version and content hash, nothing else in the cache dir is listed, evicted or cleared
+MODEL_CACHE_NAME = re.compile(r"v\d+-[0-9a-f]{40}" + re.escape(MODEL_CACHE_SUFFIX))
+
+DEFAULT_MODEL_CACHE_SIZE = 256 * 1024 * 1024
+
+USAGE = "usage -d <cache_dir> -l (list entries) -c (clear) --max-size <MB> (evict down to size)"
+
+def defaultModelCacheDir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "unittest_generator")
+
+def modelCacheFile(cache_dir, content):
+    content_hash = hashlib.sha1(content).hexdigest()
+    return os.path.join(cache_dir, "v{}-{}{}".format(MODEL_CACHE_VERSION, content_hash, MODEL_CACHE_SUFFIX))
+
+def listModelCache(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if MODEL_CACHE_NAME.fullmatch(name):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(cache_dir, name)))
+    return sorted(entries)
+
+def evictModelCache(cache_dir, max_size=DEFAULT_MODEL_CACHE_SIZE):
+    entries = listModelCache(cache_dir)
+    total_size = sum(size for mtime, size, cache_file in entries)
+    for mtime, size, cache_file in entries:
+        if total_size <= max_size:
+            break
+        os.remove(cache_file)
+        total_size -= size
+
+def clearModelCache(cache_dir):
+    for mtime, size, cache_file in listModelCache(cache_dir):
+        os.remove(cache_file)
+
+def loadHeaderModel(file_name, cache_dir=None, max_size=DEFAULT_MODEL_CACHE_SIZE, stats=None):
+    if stats is None:
+        stats = GeneratorStats()
+    with stats.phase("read"):
+        with open(file_name, 'rb') as file_object:
+            content = file_object.read()
+        text = content.decode().replace("\r\n", "\n")
+    stats.headers += 1
+    stats.lines += text.count("\n")
+    # a cache hit is counted as matching, it replaces the parse
+    with stats.phase("match"):
+        return loadCachedHeaderModel(file_name, content, text, cache_dir, max_size)
+
+def loadCachedHeaderModel(file_name, content, text, cache_dir, max_size):
+    if cache_dir is None:
+        return buildHeaderModel(file_name, text)
+
+    cache_file = modelCacheFile(cache_dir, content)
+    try:
+        with open(cache_file, 'rb') as file_object:
+            model = pickle.load(file_object)
+        # bump the mtime so eviction drops the least recently used entries first
+        os.utime(cache_file)
+        model.file_name = file_name
+        return model
+    except Exception:
+        # a corrupt pickle can raise almost anything, it is a miss and the entry is replaced
+        pass
+
+    model = buildHeaderModel(file_name, text)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so a concurrent run never loads a partial entry
+    temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    with open(temp_file, 'wb') as file_object:
+        pickle.dump(model, file_object, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+    evictModelCache(cache_dir, max_size)
+    return model
+
+def printModelCache(cache_dir):
+    entries = listModelCache(cache_dir)
+    now = time.time()
+    for mtime, size, cache_file in reversed(entries):
+        try:
+            with open(cache_file, 'rb') as file_object:
+                header = pickle.load(file_object).file_name
+        except Exception:
+            header = "<unreadable>"
+        print("{}  {:>10}  {:>8.0f}s ago  {}".format(os.path.basename(cache_file), size, now - mtime, header))
+    print("entries: {}, size: {}, dir: {}".format(len(entries), sum(size for mtime, size, cache_file in entries), cache_dir))
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hd:lc", ["max-size="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+
+    cache_dir = defaultModelCacheDir()
+    list_entries = False
+    clear = False
+    max_size = None
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        elif opt == "-d":
+            cache_dir = arg
+        elif opt == "-l":
+            list_entries = True
+        elif opt == "-c":
+            clear = True
+        elif opt == "--max-size":
+            try:
+                max_size = int(arg) * 1024 * 1024
+            except ValueError:
+                print("max size shall be a number")
+                sys.exit(2)
+
+    if clear:
+        clearModelCache(cache_dir)
+    if max_size is not None:
+        evictModelCache(cache_dir, max_size)
+    if list_entries or (clear == False and max_size is None):
+        printModelCache(cache_dir)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+'''
+    Change notification for the watch mode of unittest_generator
+    On Linux the directories of the watched tree are registered with inotify through ctypes, a poll
+    reads the queued events and costs nothing while no file is saved. Elsewhere, or when inotify
+    runs out of watches, HeaderWatcher.create returns None and the caller stats the files itself
+    Known issues:
+    1. A directory is only watched once it was added, files saved in a new directory before the
+       caller rescans the tree are found by that rescan
+'''
+
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event: int wd, uint32_t mask, uint32_t cookie, uint32_t len, then len bytes of name
+EVENT_HEADER = struct.Struct("iIII")
+
+class HeaderWatcher:
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.directories = {}
+        self.watch_descriptors = {}
+
+    @staticmethod
+    def create():
+        if sys.platform.startswith("linux") == False:
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return HeaderWatcher(libc, fd)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def watch(self, directory):
+        # returns False when the directory can not be watched, e.g. max_user_watches is reached
+        directory = os.path.abspath(directory)
+        if directory in self.watch_descriptors:
+            return True
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            return ctypes.get_errno() == errno.ENOENT
+        self.directories[wd] = directory
+        self.watch_descriptors[directory] = wd
+        return True
+
+    def watchTree(self, root):
+        for dir_path, dir_names, file_names in os.walk(root):
+            if self.watch(dir_path) == False:
+                return False
+        return True
+
+    def changes(self):
+        # returns the absolute paths of the files changed since the last call and whether a directory
+        # was created, removed or moved, or events were lost, so the caller shall rescan the tree
+        paths = set()
+        rescan = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    rescan = True
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    if mask & IN_IGNORED:
+                        del self.directories[wd]
+                        del self.watch_descriptors[directory]
+                    rescan = True
+                    continue
+                if mask & IN_ISDIR:
+                    rescan = True
+                    continue
+                paths.add(os.path.join(directory, os.fsdecode(name)))
+        return paths, rescan
@@ -0,0 +1,312 @@
+'''
+    Benchmark for i_frame_interval_analysis
+    startup: time a print-only run of the analysis script and check that the heavy
+             dependencies (numpy, pandas, matplotlib) are not imported on that path
+    stages: generate a synthetic ffprobe -show_frames dump, then time parse, parallel parse,
+            export and plot, each in its own process so that its peak RSS can be reported,
+            and compare frames/s and peak RSS with a stored baseline, the peak RSS of parse_parallel
+            includes its workers, and its frames/s is only compared on a baseline of the same core count
+'''
+
+import sys
+import getopt
+import os
+import subprocess
+import tempfile
+import time
+import json
+import random
+import resource
+
+ANALYSIS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "i_frame_interval_analysis.py")
+
+HEAVY_MODULES = ["numpy", "pandas", "matplotlib"]
+
+DEFAULT_STARTUP_RUNS = 5
+
+DEFAULT_MAX_STARTUP_TIME = 0.25
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "i_frame_benchmark_baseline.json")
+
+DEFAULT_FRAME_COUNT = 100000
+
+DEFAULT_STREAM_COUNT = 2
+
+DEFAULT_GOP_PATTERN = "IBBPBBPBBPBBPBBPBBPBBPBB"
+
+DEFAULT_NOISE_FIELD_COUNT = 10
+
+DEFAULT_WORKERS = 4
+
+DEFAULT_TOLERANCE = 0.3
+
+DEFAULT_FRAME_DURATION = 0.04
+
+STAGES = ["parse", "parse_parallel", "export", "plot"]
+
+# stages whose throughput depends on the number of cores, compared only with a baseline of the same core count
+PARALLEL_STAGES = ["parse_parallel"]
+
+FRAME_TEMPLATE = (
+    "[FRAME]\n"
+    "media_type=video\n"
+    "stream_index={stream_index}\n"
+    "key_frame={key_frame}\n"
+    "pts={pts}\n"
+    "pts_time={pts_time:.6f}\n"
+    "pkt_dts={pts}\n"
+    "pkt_dts_time={pts_time:.6f}\n"
+    "best_effort_timestamp={pts}\n"
+    "best_effort_timestamp_time={pts_time:.6f}\n"
+    "pkt_duration=3600\n"
+    "pkt_duration_time=0.040000\n"
+    "pkt_pos={pkt_pos}\n"
+    "pkt_size={pkt_size}\n"
+    "width=3840\n"
+    "height=2160\n"
+    "pix_fmt=yuv420p\n"
+    "sample_aspect_ratio=1:1\n"
+    "pict_type={pict_type}\n"
+    "coded_picture_number={frame}\n"
+    "display_picture_number=0\n"
+    "interlaced_frame=0\n"
+    "top_field_first=0\n"
+    "repeat_pict=0\n"
+    "color_range=tv\n"
+    "color_space=bt709\n"
+    "color_primaries=bt709\n"
+    "color_transfer=bt709\n"
+    "chroma_location=left\n"
+    "{noise}"
+    "[/FRAME]\n"
+)
+
+STARTUP_FRAME_INFO = (
+    "[FRAME]\n"
+    "stream_index=0\n"
+    "pts_time=0.000000\n"
+    "pict_type=I\n"
+    "[/FRAME]\n"
+)
+
+IMPORT_CHECK = (
+    "import sys\n"
+    "sys.path.insert(0, {!r})\n"
+    "import i_frame_interval_analysis\n"
+    "print(','.join(name for name in {!r} if name in sys.modules))\n"
+)
+
+def heavy_modules_on_import():
+    code = IMPORT_CHECK.format(os.path.dirname(ANALYSIS_SCRIPT), HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+    return [name for name in output.split(",") if name != ""]
+
+def measure_startup(runs=DEFAULT_STARTUP_RUNS):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        frame_info_file = os.path.join(temp_dir, "frames.txt")
+        with open(frame_info_file, "w") as file_object:
+            file_object.write(STARTUP_FRAME_INFO)
+
+        timings = []
+        for i in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, ANALYSIS_SCRIPT, "-i", frame_info_file, "-s", "0"], stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def startup_benchmark(runs=DEFAULT_STARTUP_RUNS, max_startup_time=DEFAULT_MAX_STARTUP_TIME):
+    result = {"startup_time": measure_startup(runs),
+              "max_startup_time": max_startup_time,
+              "heavy_modules": heavy_modules_on_import()}
+    failures = []
+    if len(result["heavy_modules"]) > 0:
+        failures.append("heavy modules imported on the print-only path: " + ", ".join(result["heavy_modules"]))
+    if result["startup_time"] > max_startup_time:
+        failures.append("startup time {:.3f}s is over {:.3f}s".format(result["startup_time"], max_startup_time))
+    result["failures"] = failures
+    return result
+
+def generate_frame_info(file_object, frame_count=DEFAULT_FRAME_COUNT, stream_count=DEFAULT_STREAM_COUNT,
+                        gop_pattern=DEFAULT_GOP_PATTERN, noise_field_count=DEFAULT_NOISE_FIELD_COUNT, seed=0):
+    # frames of all streams are interleaved like in a muxed recording, every stream
+    # repeats gop_pattern, pkt_size and the noise fields are random
+    rng = random.Random(seed)
+    pkt_pos = 0
+    for frame in range(frame_count):
+        stream_index = frame % stream_count
+        stream_frame = frame // stream_count
+        pict_type = gop_pattern[stream_frame % len(gop_pattern)]
+        pkt_size = rng.randint(40000, 400000) if pict_type == "I" else rng.randint(2000, 60000)
+        noise = "".join("TAG:noise_{}={:08x}\n".format(i, rng.getrandbits(32)) for i in range(noise_field_count))
+        file_object.write(FRAME_TEMPLATE.format(stream_index=stream_index, key_frame=int(pict_type == "I"),
+                                                pts=stream_frame * 3600, pts_time=stream_frame * DEFAULT_FRAME_DURATION,
+                                                pkt_pos=pkt_pos, pkt_size=pkt_size, pict_type=pict_type,
+                                                frame=stream_frame, noise=noise))
+        pkt_pos += pkt_size
+
+def peak_rss(include_children=False):
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the workers of a pool are waited for when it is closed, RUSAGE_CHILDREN then gives the
+    # peak of the largest worker, so this is a lower bound of the peak of the whole stage
+    if include_children:
+        rss += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def run_stage(stage, frame_info_file, workers=DEFAULT_WORKERS):
+    # runs inside the child process started by benchmark_stage
+    import i_frame_interval_analysis as analysis
+
+    if stage == "parse":
+        start = time.perf_counter()
+        analysis.caculate_i_frame_all_streams(frame_info_file)
+    elif stage == "parse_parallel":
+        start = time.perf_counter()
+        analysis.caculate_i_frame_all_streams(frame_info_file, workers)
+    else:
+        i_frame_interval_table = analysis.caculate_i_frame_all_streams(frame_info_file)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if stage == "export":
+                start = time.perf_counter()
+                analysis.export_rows(analysis.iter_table_rows(i_frame_interval_table), os.path.join(temp_dir, "export.csv"))
+            else:
+                analysis.import_pyplot(True)
+                start = time.perf_counter()
+                analysis.draw_by_table(i_frame_interval_table, "i frame interval", "i frame", "interval",
+                                       plot_file_name=os.path.join(temp_dir, "plot.png"))
+    return {"seconds": time.perf_counter() - start, "peak_rss": peak_rss(stage in PARALLEL_STAGES)}
+
+def benchmark_stage(stage, frame_info_file, frame_count, workers=DEFAULT_WORKERS):
+    command = [sys.executable, os.path.abspath(__file__), "--stage", stage, "-i", frame_info_file, "-j", str(workers)]
+    result = json.loads(subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout)
+    size = os.path.getsize(frame_info_file)
+    result["mb_per_s"] = size / (1024 * 1024) / result["seconds"]
+    result["frames_per_s"] = frame_count / result["seconds"]
+    return result
+
+def compare_with_baseline(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    failures = []
+    for stage, baseline_stage in baseline["stages"].items():
+        if stage not in result["stages"]:
+            continue
+        cur_stage = result["stages"][stage]
+        same_cores = stage not in PARALLEL_STAGES or baseline.get("cpu_count") == result["cpu_count"]
+        if same_cores and cur_stage["frames_per_s"] < baseline_stage["frames_per_s"] * (1 - tolerance):
+            failures.append("{}: {:.0f} frames/s is below baseline {:.0f} frames/s".format(
+                stage, cur_stage["frames_per_s"], baseline_stage["frames_per_s"]))
+        if cur_stage["peak_rss"] > baseline_stage["peak_rss"] * (1 + tolerance):
+            failures.append("{}: peak rss {} bytes is above baseline {} bytes".format(
+                stage, cur_stage["peak_rss"], baseline_stage["peak_rss"]))
+    return failures
+
+def stage_benchmark(frame_count=DEFAULT_FRAME_COUNT, stream_count=DEFAULT_STREAM_COUNT, gop_pattern=DEFAULT_GOP_PATTERN,
+                    noise_field_count=DEFAULT_NOISE_FIELD_COUNT, workers=DEFAULT_WORKERS, stages=STAGES):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        frame_info_file = os.path.join(temp_dir, "frames.txt")
+        with open(frame_info_file, "w") as file_object:
+            generate_frame_info(file_object, frame_count, stream_count, gop_pattern, noise_field_count)
+        return {"frame_count": frame_count,
+                "stream_count": stream_count,
+                "gop_pattern": gop_pattern,
+                "noise_field_count": noise_field_count,
+                "workers": workers,
+                "cpu_count": os.cpu_count(),
+                "size": os.path.getsize(frame_info_file),
+                "stages": {stage: benchmark_stage(stage, frame_info_file, frame_count, workers) for stage in stages}}
+
+def main(argv):
+    runs = DEFAULT_STARTUP_RUNS
+    max_startup_time = DEFAULT_MAX_STARTUP_TIME
+    frame_count = DEFAULT_FRAME_COUNT
+    stream_count = DEFAULT_STREAM_COUNT
+    gop_pattern = DEFAULT_GOP_PATTERN
+    noise_field_count = DEFAULT_NOISE_FIELD_COUNT
+    workers = DEFAULT_WORKERS
+    baseline_file = DEFAULT_BASELINE_FILE
+    update_baseline = False
+    tolerance = DEFAULT_TOLERANCE
+    stage = None
+    input = None
+    generate = None
+
+    usage = ("usage: -n <runs> -f <frames> -j <workers> --max-startup <seconds> --streams <count> --gop <pattern> "
+             "--noise <fields> --baseline <file> --update-baseline --tolerance <ratio> --generate <file>")
+
+    try:
+        opts, args = getopt.getopt(argv, "hn:f:j:i:", ["max-startup=", "streams=", "gop=", "noise=", "baseline=",
+                                                       "update-baseline", "tolerance=", "generate=", "stage="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            print("with --generate, only a synthetic ffprobe -show_frames dump is written to <file>")
+            print("without --update-baseline, a stage slower or bigger than the baseline by more than <ratio> fails")
+            sys.exit()
+        elif opt in ("-n", "-f", "-j", "--streams", "--noise", "--max-startup", "--tolerance"):
+            try:
+                value = float(arg) if opt in ("--max-startup", "--tolerance") else int(arg)
+            except ValueError:
+                print("{} shall be a number".format(opt))
+                sys.exit(2)
+            if opt == "-n":
+                runs = value
+            elif opt == "-f":
+                frame_count = value
+            elif opt == "-j":
+                workers = value
+            elif opt == "--streams":
+                stream_count = value
+            elif opt == "--noise":
+                noise_field_count = value
+            elif opt == "--max-startup":
+                max_startup_time = value
+            else:
+                tolerance = value
+        elif opt == "--gop":
+            gop_pattern = arg
+        elif opt == "--baseline":
+            baseline_file = arg
+        elif opt == "--update-baseline":
+            update_baseline = True
+        elif opt == "--generate":
+            generate = arg
+        elif opt == "--stage":
+            stage = arg
+        elif opt == "-i":
+            input = arg
+
+    if stage is not None:
+        print(json.dumps(run_stage(stage, input, workers)))
+        return
+
+    if generate is not None:
+        with open(generate, "w") as file_object:
+            generate_frame_info(file_object, frame_count, stream_count, gop_pattern, noise_field_count)
+        return
+
+    result = stage_benchmark(frame_count, stream_count, gop_pattern, noise_field_count, workers)
+    result["startup"] = startup_benchmark(runs, max_startup_time)
+    failures = list(result["startup"]["failures"])
+
+    if update_baseline:
+        with open(baseline_file, "w") as file_object:
+            json.dump({"tolerance": tolerance, "frame_count": frame_count, "workers": workers, "cpu_count": result["cpu_count"],
+                       "stages": result["stages"]}, file_object, indent=4)
+    elif os.path.exists(baseline_file):
+        with open(baseline_file) as file_object:
+            baseline = json.load(file_object)
+        if baseline["frame_count"] != frame_count:
+            print("baseline was recorded with {} frames, use -f {}".format(baseline["frame_count"], baseline["frame_count"]))
+            sys.exit(2)
+        failures += compare_with_baseline(result, baseline, tolerance)
+
+    result["failures"] = failures
+    print(json.dumps(result, indent=4))
+    if len(failures) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,97 +1,916 @@
-import sys
-import getopt
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-
-def caculate_i_frame(frame_info_file, stream_index):
-    with open(frame_info_file) as file_object:
-        lines = file_object.readlines()
-
-    list_i_frame_interval = []
-    previous_time = 0
-    cur_time = 0
-    i_frame = False
-    valid_frame = False
-
-    for line in lines:
-        if line.find("stream_index=") != -1:
-            cur_index = int(line[13:])
-            if cur_index == stream_index:
-                valid_frame = True
-        elif line.find("pts_time=") != -1:
-            cur_time = float(line[9:])
-        elif "pict_type=I" in line:
-            i_frame = True
-        elif "[/FRAME]" in line:
-            if i_frame == True and valid_frame == True:
-                list_i_frame_interval.append(cur_time - previous_time)
-                previous_time = cur_time
-            cur_time = 0
-            i_frame = False
-            valid_frame = False
-
-    return list_i_frame_interval
-
-def list_to_excel(list, excel_file_name):
-    df = pd.DataFrame(list)
-    df.to_excel(excel_file_name, index=False)
-
-def draw_by_list(list, title, xlabel, ylabel):
-    plt.plot(list)
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.show()
-
-def main(argv):
-    input = None
-    output = None
-    stream_index = None
-    export_plot = False
-    export_xlsx = False
-
-    try:
-        opts, args = getopt.getopt(argv, "hxpi:s:o:")
-    except getopt.GetoptError:
-        print("usage: -x (output result to xlsx) -p (output result to plot) -i <inputfile> -s <stream_index> -o <outputfile>")
-        sys.exit(2)
-
-    for opt, arg in opts:
-        if opt == "-h":
-            print("usage: -x (output result to xlsx) -p (output result to plot) -i <inputfile> -s <stream_index> -o <outputfile>")
-            print("input file shall be output of ffprobe -i -show_frames")
-            sys.exit()
-        elif opt == "-x":
-            export_xlsx = True
-        elif opt == "-p":
-            export_plot = True
-        elif opt == "-i":
-            input = arg
-        elif opt == "-s":
-            try:
-                stream_index = int(arg)
-            except ValueError:
-                print("stream_index shall be a number")
-                sys.exit(2)
-        elif opt == "-o":
-            output = arg
-    
-    if input is None or os.path.exists(input) == False or stream_index is None:
-        print("invalid input")
-        sys.exit(2)
-
-    i_frame_interval_list = caculate_i_frame(input, stream_index)
-    print(i_frame_interval_list)
-
-    if export_plot:
-        draw_by_list(i_frame_interval_list, "i frame interval", "i frame", "interval")
-    
-    if export_xlsx:
-        if output is None:
-            print("invalid output")
-            sys.exit(2)
-        list_to_excel(i_frame_interval_list, output)
-
-if __name__ == "__main__":
+import sys
+import getopt
+import os
+import contextlib
+import subprocess
+import re
+import mmap
+import multiprocessing
+import glob
+import csv
+import json
+import array
+import zipfile
+import hashlib
+import time
+import threading
+import itertools
+import collections
+import statistics
+
+# numpy, pandas and matplotlib are imported by the functions that need them,
+# so parsing and printing intervals does not pay for importing them
+
+DEFAULT_FFPROBE = "ffprobe"
+
+FFPROBE_ARGS = ["-v", "error",
+                "-show_entries", "frame=stream_index,pts_time,pict_type,pkt_size",
+                "-of", "compact=p=0"]
+
+FRAME_INFO_CHUNK_SIZE = 64 * 1024 * 1024
+
+DEFAULT_GOP_TOLERANCE = 0.1
+
+DEFAULT_GOP_HISTOGRAM_BINS = 50
+
+DUPLICATE_I_FRAME_INTERVAL = 1e-6
+
+PICT_TYPE_UNKNOWN = 0
+
+PICT_TYPE_CODES = {"I": 1, "P": 2, "B": 3, "S": 4, "SI": 5, "SP": 6, "BI": 7}
+
+FRAME_CACHE_VERSION = 1
+
+FRAME_CACHE_SUFFIX = ".npz"
+
+# entries are named by the sha1 of their key, nothing else in the cache dir is listed, evicted or cleared
+FRAME_CACHE_NAME = re.compile("[0-9a-f]{40}" + re.escape(FRAME_CACHE_SUFFIX))
+
+DEFAULT_FRAME_CACHE_SIZE = 1024 * 1024 * 1024
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+EXPORT_FIELDS = ["stream", "i_frame", "interval"]
+
+EXPORT_BATCH_SIZE = 64 * 1024
+
+DEFAULT_FOLLOW_WINDOW = 100
+
+DEFAULT_FOLLOW_POLL_INTERVAL = 0.05
+
+DEFAULT_FOLLOW_SUMMARY_INTERVAL = 10.0
+
+SUMMARY_FIELDS = ["file", "stream", "gop_count", "min_gop", "max_gop", "mean_gop", "p99_gop", "irregular_gop_count",
+                  "duplicate_i_frame_count", "missing_i_frame_count", "drift", "error"]
+
+USAGE = ("usage: -x (output result to xlsx, csv or parquet by <outputfile> suffix) -p (output result to plot) -m (run ffprobe on a media file) -b (batch mode) "
+         "-c (cache parsed frames) -i <inputfile> -s <stream_index|all> -o <outputfile> -j <workers> --ffprobe <ffprobe_path> "
+         "--cache-dir <dir> --cache-size <MB> --cache-hash --refresh-cache --clear-cache --plot-points <n> --plot-file <imagefile> "
+         "--follow --window <n> --target-gop <seconds> --tolerance <ratio> --summary-interval <seconds> --histogram <bins>")
+
+def open_frame_info(frame_info_file):
+    if frame_info_file == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(frame_info_file)
+
+def iter_frames(lines):
+    cur_index = None
+    cur_time = 0
+    pict_type = None
+    pkt_size = None
+
+    for line in lines:
+        if line.find("stream_index=") != -1:
+            cur_index = int(line[13:])
+        elif line.find("pts_time=") != -1:
+            cur_time = float(line[9:])
+        elif line.startswith("pict_type="):
+            pict_type = line[10:].strip()
+        elif line.startswith("pkt_size=") and line[9:].strip().isdigit():
+            pkt_size = int(line[9:])
+        elif "[/FRAME]" in line:
+            yield cur_index, cur_time, pict_type, pkt_size
+            cur_index = None
+            cur_time = 0
+            pict_type = None
+            pkt_size = None
+
+def read_frame_info(frame_info_file):
+    with open_frame_info(frame_info_file) as file_object:
+        yield from iter_frames(file_object)
+
+def split_frame_info(mapped, chunk_count):
+    size = len(mapped)
+    bounds = [0]
+    for i in range(1, chunk_count):
+        pos = mapped.find(b"[FRAME]", max(size * i // chunk_count, bounds[-1] + 1))
+        if pos == -1:
+            break
+        bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def parse_frame_info_chunk(task):
+    # only i frames and the first frame of each stream can affect the intervals,
+    # so unless all frames are asked for only those are sent back to the parent process
+    frame_info_file, start, end, i_frame_only = task
+    frames = []
+    streams = set()
+    with open(frame_info_file, "rb") as file_object:
+        with mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            lines = mapped[start:end].decode().splitlines()
+    for frame in iter_frames(lines):
+        if i_frame_only == False or frame[2] == "I" or frame[0] not in streams:
+            frames.append(frame)
+            streams.add(frame[0])
+    return frames
+
+def read_frame_info_parallel(frame_info_file, workers, i_frame_only=True):
+    if frame_info_file == "-" or workers <= 1 or os.path.getsize(frame_info_file) == 0:
+        yield from read_frame_info(frame_info_file)
+        return
+
+    with open(frame_info_file, "rb") as file_object:
+        with mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            chunk_count = max(workers * 4, len(mapped) // FRAME_INFO_CHUNK_SIZE + 1)
+            tasks = [(frame_info_file, start, end, i_frame_only) for start, end in split_frame_info(mapped, chunk_count)]
+
+    # chunks come back in file order, so the intervals at chunk seams are
+    # computed from the last i frame of the previous chunk as in the serial path
+    with multiprocessing.Pool(workers) as pool:
+        for frames in pool.imap(parse_frame_info_chunk, tasks):
+            yield from frames
+
+def follow_lines(file_name, poll_interval=DEFAULT_FOLLOW_POLL_INTERVAL):
+    # like tail -f, a partially written line is held back until its newline arrives
+    with open(file_name) as file_object:
+        pending = ""
+        while True:
+            line = file_object.readline()
+            if line == "":
+                time.sleep(poll_interval)
+                if os.path.getsize(file_name) < file_object.tell():
+                    file_object.seek(0)
+                    pending = ""
+                continue
+            pending += line
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+
+def iter_compact_frames(lines):
+    for line in lines:
+        cur_index = None
+        cur_time = 0
+        pict_type = None
+        pkt_size = None
+        # ffprobe writes N/A or nothing for a field it does not know, the field is then left at its default
+        for field in line.rstrip().split("|"):
+            key, _, value = field.partition("=")
+            if key == "stream_index" and value.isdigit():
+                cur_index = int(value)
+            elif key == "pts_time" and value not in ("", "N/A"):
+                cur_time = float(value)
+            elif key == "pict_type" and value not in ("", "N/A"):
+                pict_type = value
+            elif key == "pkt_size" and value.isdigit():
+                pkt_size = int(value)
+        yield cur_index, cur_time, pict_type, pkt_size
+
+def probe_frames(media_file, stream_index=None, ffprobe=DEFAULT_FFPROBE):
+    command = [ffprobe] + FFPROBE_ARGS
+    if stream_index is not None:
+        command += ["-select_streams", str(stream_index)]
+    command.append("pipe:0" if media_file == "-" else media_file)
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        yield from iter_compact_frames(process.stdout)
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+def iter_i_frame_interval_rows(frames, stream_index=None):
+    previous_time = {}
+    i_frame_count = {}
+
+    for cur_index, cur_time, pict_type, pkt_size in frames:
+        if pict_type != "I" or cur_index is None or (stream_index is not None and cur_index != stream_index):
+            continue
+        i_frame = i_frame_count.get(cur_index, 0)
+        yield cur_index, i_frame, cur_time - previous_time.get(cur_index, 0)
+        previous_time[cur_index] = cur_time
+        i_frame_count[cur_index] = i_frame + 1
+
+def i_frame_interval_of_frames(frames, stream_index):
+    for cur_index, i_frame, interval in iter_i_frame_interval_rows(frames, stream_index):
+        yield interval
+
+def i_frame_interval_table_of_frames(frames):
+    i_frame_interval_table = {}
+    previous_time = {}
+
+    for cur_index, cur_time, pict_type, pkt_size in frames:
+        if cur_index is None:
+            continue
+        list_i_frame_interval = i_frame_interval_table.setdefault(cur_index, [])
+        if pict_type == "I":
+            list_i_frame_interval.append(cur_time - previous_time.get(cur_index, 0))
+            previous_time[cur_index] = cur_time
+
+    return i_frame_interval_table
+
+def iter_i_frame_interval(frame_info_file, stream_index, workers=1):
+    return i_frame_interval_of_frames(read_frame_info_parallel(frame_info_file, workers), stream_index)
+
+def caculate_i_frame(frame_info_file, stream_index, workers=1):
+    return list(iter_i_frame_interval(frame_info_file, stream_index, workers))
+
+def caculate_i_frame_all_streams(frame_info_file, workers=1):
+    return i_frame_interval_table_of_frames(read_frame_info_parallel(frame_info_file, workers))
+
+def probe_i_frame(media_file, stream_index, ffprobe=DEFAULT_FFPROBE):
+    return list(i_frame_interval_of_frames(probe_frames(media_file, stream_index, ffprobe), stream_index))
+
+def probe_i_frame_all_streams(media_file, ffprobe=DEFAULT_FFPROBE):
+    return i_frame_interval_table_of_frames(probe_frames(media_file, None, ffprobe))
+
+class FrameTable:
+    def __init__(self, pts_time, pict_type, stream_index, pkt_size=None):
+        self.pts_time = pts_time
+        self.pict_type = pict_type
+        self.stream_index = stream_index
+        self.pkt_size = pkt_size
+
+    @classmethod
+    def from_frames(cls, frames):
+        import numpy as np
+
+        # collect into typed arrays first so no python object is kept per frame
+        pts_time = array.array("d")
+        pict_type = array.array("b")
+        stream_index = array.array("i")
+        pkt_size = array.array("q")
+        has_pkt_size = False
+        for cur_index, cur_time, cur_pict_type, cur_pkt_size in frames:
+            if cur_index is None:
+                continue
+            pts_time.append(cur_time)
+            pict_type.append(PICT_TYPE_CODES.get(cur_pict_type, PICT_TYPE_UNKNOWN))
+            stream_index.append(cur_index)
+            pkt_size.append(-1 if cur_pkt_size is None else cur_pkt_size)
+            has_pkt_size = has_pkt_size or cur_pkt_size is not None
+
+        return cls(np.frombuffer(pts_time, dtype=np.float64),
+                   np.frombuffer(pict_type, dtype=np.int8),
+                   np.frombuffer(stream_index, dtype=np.int32),
+                   np.frombuffer(pkt_size, dtype=np.int64) if has_pkt_size else None)
+
+    def __len__(self):
+        return len(self.pts_time)
+
+    def streams(self):
+        import numpy as np
+
+        return [int(cur_index) for cur_index in np.unique(self.stream_index)]
+
+    def i_frame_times(self, stream_index):
+        return self.pts_time[(self.stream_index == stream_index) & (self.pict_type == PICT_TYPE_CODES["I"])]
+
+    def i_frame_interval(self, stream_index):
+        import numpy as np
+
+        # same convention as caculate_i_frame, the first interval is measured from 0
+        return np.diff(self.i_frame_times(stream_index), prepend=0.0)
+
+    def i_frame_interval_table(self):
+        return {cur_index: self.i_frame_interval(cur_index) for cur_index in self.streams()}
+
+def read_frame_table(frame_info_file, workers=1):
+    return FrameTable.from_frames(read_frame_info_parallel(frame_info_file, workers, i_frame_only=False))
+
+def probe_frame_table(media_file, stream_index=None, ffprobe=DEFAULT_FFPROBE):
+    return FrameTable.from_frames(probe_frames(media_file, stream_index, ffprobe))
+
+class GopMonitor:
+    def __init__(self, window=DEFAULT_FOLLOW_WINDOW, target_gop=None, tolerance=DEFAULT_GOP_TOLERANCE):
+        self.window = window
+        self.target_gop = target_gop
+        self.tolerance = tolerance
+        self.gops = {}
+
+    def update(self, stream_index, i_frame, interval):
+        gops = self.gops.setdefault(stream_index, collections.deque(maxlen=self.window))
+        # the first interval is the offset of the first i frame, not a gop
+        if i_frame == 0:
+            return None
+        # without a configured target the median of the current window is expected
+        target_gop = self.target_gop
+        if target_gop is None and len(gops) > 0:
+            target_gop = statistics.median(gops)
+        gops.append(interval)
+        if target_gop is not None and abs(interval - target_gop) > self.tolerance * target_gop:
+            return "alert: stream {} i frame {} interval {:.6f} outside {:.6f} +/- {:g}%".format(
+                stream_index, i_frame, interval, target_gop, self.tolerance * 100)
+        return None
+
+    def summary(self):
+        lines = []
+        for stream_index in sorted(self.gops):
+            gops = self.gops[stream_index]
+            if len(gops) == 0:
+                continue
+            lines.append("stream {}: last {} gops min {:.6f} max {:.6f} mean {:.6f}".format(
+                stream_index, len(gops), min(gops), max(gops), sum(gops) / len(gops)))
+        return lines
+
+def follow_i_frame(frames, monitor, stream_index=None, summary_interval=DEFAULT_FOLLOW_SUMMARY_INTERVAL):
+    # summaries are printed by a timer thread, so a stalled stream, blocked in a read
+    # of the file, stdin or ffprobe, still reports its last gops and how long it stalled
+    lock = threading.Lock()
+    stop = threading.Event()
+    last_i_frame = [time.monotonic()]
+
+    def print_summary():
+        while stop.wait(summary_interval) == False:
+            with lock:
+                lines = monitor.summary()
+                stalled = time.monotonic() - last_i_frame[0]
+            if stalled >= summary_interval:
+                lines.append("no i frame for {:.1f}s".format(stalled))
+            for line in lines:
+                print(line, flush=True)
+
+    summary_thread = threading.Thread(target=print_summary, daemon=True)
+    summary_thread.start()
+    try:
+        for cur_index, i_frame, interval in iter_i_frame_interval_rows(frames, stream_index):
+            with lock:
+                alert = monitor.update(cur_index, i_frame, interval)
+                last_i_frame[0] = time.monotonic()
+            if alert is not None:
+                print(alert, flush=True)
+    finally:
+        stop.set()
+        summary_thread.join()
+
+def default_frame_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "i_frame_interval_analysis")
+
+def hash_file(file_name):
+    sha1 = hashlib.sha1()
+    with open(file_name, "rb") as file_object:
+        for block in iter(lambda: file_object.read(HASH_BLOCK_SIZE), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def frame_cache_key(input, probe=False, content_hash=False):
+    stat = os.stat(input)
+    key = "{}\0{}\0{}\0{}\0{}".format(FRAME_CACHE_VERSION, os.path.abspath(input), stat.st_size, stat.st_mtime_ns, "probe" if probe else "dump")
+    if content_hash:
+        key += "\0" + hash_file(input)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def save_frame_table(table, cache_file):
+    import numpy as np
+
+    columns = {"pts_time": table.pts_time, "pict_type": table.pict_type, "stream_index": table.stream_index}
+    if table.pkt_size is not None:
+        columns["pkt_size"] = table.pkt_size
+    # write to a temporary file first so a concurrent run never loads a partial entry
+    temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    with open(temp_file, "wb") as file_object:
+        np.savez(file_object, **columns)
+    os.replace(temp_file, cache_file)
+
+def load_frame_table(cache_file):
+    import numpy as np
+
+    try:
+        with np.load(cache_file) as columns:
+            table = FrameTable(columns["pts_time"], columns["pict_type"], columns["stream_index"],
+                               columns["pkt_size"] if "pkt_size" in columns.files else None)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # a truncated or corrupt entry is a miss, the input is parsed again and the entry replaced
+        return None
+    # bump the mtime so eviction drops the least recently used entries first
+    os.utime(cache_file)
+    return table
+
+def list_frame_cache(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if FRAME_CACHE_NAME.fullmatch(name):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(cache_dir, name)))
+    return sorted(entries)
+
+def evict_frame_cache(cache_dir, max_size=DEFAULT_FRAME_CACHE_SIZE):
+    entries = list_frame_cache(cache_dir)
+    total_size = sum(size for mtime, size, cache_file in entries)
+    for mtime, size, cache_file in entries:
+        if total_size <= max_size:
+            break
+        os.remove(cache_file)
+        total_size -= size
+
+def clear_frame_cache(cache_dir):
+    for mtime, size, cache_file in list_frame_cache(cache_dir):
+        os.remove(cache_file)
+
+def cached_frame_table(input, cache_dir, probe=False, ffprobe=DEFAULT_FFPROBE, workers=1,
+                       content_hash=False, refresh=False, max_size=DEFAULT_FRAME_CACHE_SIZE):
+    cache_file = os.path.join(cache_dir, frame_cache_key(input, probe, content_hash) + FRAME_CACHE_SUFFIX)
+    if refresh == False and os.path.exists(cache_file):
+        table = load_frame_table(cache_file)
+        if table is not None:
+            return table
+
+    # probe all streams so the entry can be reused with any -s
+    if probe:
+        table = probe_frame_table(input, None, ffprobe)
+    else:
+        table = read_frame_table(input, workers)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_frame_table(table, cache_file)
+    evict_frame_cache(cache_dir, max_size)
+    return table
+
+def gop_summary(i_frame_interval, tolerance=DEFAULT_GOP_TOLERANCE, target_gop=None):
+    import numpy as np
+
+    # the first interval is the offset of the first i frame, not a gop
+    gops = np.asarray(i_frame_interval, dtype=np.float64)[1:]
+    if len(gops) == 0:
+        return {"gop_count": 0, "min_gop": None, "max_gop": None, "mean_gop": None, "p99_gop": None, "irregular_gop_count": 0,
+                "duplicate_i_frame_count": 0, "missing_i_frame_count": None if target_gop is None else 0, "drift": None}
+    median = np.median(gops)
+    summary = {"gop_count": len(gops),
+               "min_gop": float(gops.min()),
+               "max_gop": float(gops.max()),
+               "mean_gop": float(gops.mean()),
+               "p99_gop": float(np.percentile(gops, 99)),
+               "irregular_gop_count": int(np.count_nonzero(np.abs(gops - median) > tolerance * median)),
+               "duplicate_i_frame_count": len(find_duplicate_i_frames(i_frame_interval)),
+               "missing_i_frame_count": None,
+               "drift": None}
+    # missing i frames and drift are only defined against a target gop
+    if target_gop is not None:
+        index, missing = find_missing_i_frames(i_frame_interval, target_gop, tolerance)
+        summary["missing_i_frame_count"] = int(missing.sum())
+        summary["drift"] = float(gop_drift(i_frame_interval, target_gop)[1][-1])
+    return summary
+
+def gop_histogram(i_frame_interval, bins=DEFAULT_GOP_HISTOGRAM_BINS):
+    import numpy as np
+
+    return np.histogram(np.asarray(i_frame_interval, dtype=np.float64)[1:], bins=bins)
+
+def gop_drift(i_frame_interval, target_gop):
+    import numpy as np
+
+    # per gop deviation from the target and the accumulated drift of the keyframe cadence
+    drift = np.asarray(i_frame_interval, dtype=np.float64)[1:] - target_gop
+    return drift, np.cumsum(drift)
+
+def find_missing_i_frames(i_frame_interval, target_gop, tolerance=DEFAULT_GOP_TOLERANCE):
+    import numpy as np
+
+    # returns the gop index and the number of keyframes missing inside that gop
+    gops = np.asarray(i_frame_interval, dtype=np.float64)[1:]
+    missing = np.rint(gops / target_gop).astype(np.int64) - 1
+    index = np.flatnonzero((gops > target_gop * (1 + tolerance)) & (missing > 0))
+    return index, missing[index]
+
+def find_duplicate_i_frames(i_frame_interval, min_interval=DUPLICATE_I_FRAME_INTERVAL):
+    import numpy as np
+
+    # keyframes at the same timestamp as the previous keyframe
+    return np.flatnonzero(np.asarray(i_frame_interval, dtype=np.float64)[1:] <= min_interval)
+
+def gop_check_lines(stream_index, i_frame_interval, target_gop, tolerance=DEFAULT_GOP_TOLERANCE):
+    drift, accumulated_drift = gop_drift(i_frame_interval, target_gop)
+    if len(drift) == 0:
+        return ["stream {}: no gop to check".format(stream_index)]
+    lines = ["stream {}: drift {:.6f}s over {} gops, largest gop deviation {:.6f}s".format(
+        stream_index, accumulated_drift[-1], len(drift), drift[abs(drift).argmax()])]
+    for index, missing in zip(*find_missing_i_frames(i_frame_interval, target_gop, tolerance)):
+        lines.append("stream {}: gop {} is missing {} i frame(s)".format(stream_index, index, missing))
+    for index in find_duplicate_i_frames(i_frame_interval):
+        lines.append("stream {}: gop {} is a duplicate i frame".format(stream_index, index))
+    return lines
+
+def analyze_file(task):
+    input, stream_index, probe, ffprobe, tolerance, target_gop = task
+    try:
+        if probe:
+            frames = probe_frames(input, stream_index, ffprobe)
+        else:
+            frames = read_frame_info(input)
+        if stream_index is None:
+            i_frame_interval_table = i_frame_interval_table_of_frames(frames)
+        else:
+            i_frame_interval_table = {stream_index: list(i_frame_interval_of_frames(frames, stream_index))}
+    except Exception as error:
+        return [{"file": input, "error": str(error)}]
+    # every input gets a row, so a file that is not a frame dump or an empty capture is not silently dropped
+    if len(i_frame_interval_table) == 0:
+        return [{"file": input, "error": "no frames"}]
+
+    rows = []
+    for cur_index in sorted(i_frame_interval_table):
+        row = {"file": input, "stream": cur_index, "error": None}
+        row.update(gop_summary(i_frame_interval_table[cur_index], tolerance, target_gop))
+        rows.append(row)
+    return rows
+
+def find_batch_inputs(pattern):
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(root, name) for root, dirs, names in os.walk(pattern) for name in names)
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+def batch_analysis(inputs, stream_index=None, workers=1, probe=False, ffprobe=DEFAULT_FFPROBE, tolerance=DEFAULT_GOP_TOLERANCE, target_gop=None):
+    tasks = [(input, stream_index, probe, ffprobe, tolerance, target_gop) for input in inputs]
+    rows = []
+    with multiprocessing.Pool(max(workers, 1)) as pool:
+        for file_rows in pool.imap_unordered(analyze_file, tasks):
+            for row in file_rows:
+                if row["error"] is not None:
+                    print("fail to analyze {}: {}".format(row["file"], row["error"]))
+            rows += file_rows
+    rows.sort(key=lambda row: (row["file"], row.get("stream", -1)))
+    return rows
+
+def write_summary(rows, summary_file_name):
+    if summary_file_name is not None and summary_file_name.endswith(".json"):
+        with open(summary_file_name, "w") as file_object:
+            json.dump(rows, file_object, indent=4)
+        return
+
+    with open(summary_file_name, "w", newline="") if summary_file_name is not None else contextlib.nullcontext(sys.stdout) as file_object:
+        writer = csv.DictWriter(file_object, SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def iter_table_rows(table):
+    for stream_index in sorted(table):
+        for i_frame, interval in enumerate(table[stream_index]):
+            yield stream_index, i_frame, interval
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+def export_csv(rows, csv_file_name):
+    with open(csv_file_name, "w", newline="") as file_object:
+        writer = csv.writer(file_object)
+        writer.writerow(EXPORT_FIELDS)
+        for batch in iter_batches(rows, EXPORT_BATCH_SIZE):
+            writer.writerows(batch)
+
+def export_parquet(rows, parquet_file_name):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(EXPORT_FIELDS[0], pa.int32()), (EXPORT_FIELDS[1], pa.int64()), (EXPORT_FIELDS[2], pa.float64())])
+    with pq.ParquetWriter(parquet_file_name, schema) as writer:
+        for batch in iter_batches(rows, EXPORT_BATCH_SIZE):
+            columns = [pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+def export_rows(rows, output_file_name):
+    if output_file_name.endswith(".parquet"):
+        export_parquet(rows, output_file_name)
+    else:
+        export_csv(rows, output_file_name)
+
+def downsample_min_max(list, max_points):
+    import numpy as np
+
+    # keep the min and max of every bucket so spikes stay visible after downsampling
+    y = np.asarray(list, dtype=np.float64)
+    if max_points is None or len(y) <= max_points:
+        return np.arange(len(y)), y
+    bucket_size = -(-len(y) // (max_points // 2))
+    bucket_count = len(y) // bucket_size
+    buckets = y[:bucket_count * bucket_size].reshape(bucket_count, bucket_size)
+    offsets = np.arange(bucket_count) * bucket_size
+    x = np.concatenate([offsets + buckets.argmin(axis=1), offsets + buckets.argmax(axis=1), np.arange(bucket_count * bucket_size, len(y))])
+    x = np.unique(x)
+    return x, y[x]
+
+def import_pyplot(headless=False):
+    import matplotlib
+    if headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def show_plot(plt, plot_file_name):
+    if plot_file_name is None:
+        plt.show()
+    else:
+        plt.savefig(plot_file_name)
+        plt.close()
+
+def list_to_excel(list, excel_file_name):
+    import pandas as pd
+
+    df = pd.DataFrame(list)
+    df.to_excel(excel_file_name, index=False)
+
+def table_to_excel(table, excel_file_name):
+    import pandas as pd
+
+    with pd.ExcelWriter(excel_file_name) as writer:
+        for stream_index in sorted(table):
+            pd.DataFrame(table[stream_index]).to_excel(writer, sheet_name="stream_{}".format(stream_index), index=False)
+
+def draw_by_list(list, title, xlabel, ylabel, max_points=None, plot_file_name=None):
+    plt = import_pyplot(plot_file_name is not None)
+    plt.plot(*downsample_min_max(list, max_points))
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    show_plot(plt, plot_file_name)
+
+def draw_by_table(table, title, xlabel, ylabel, max_points=None, plot_file_name=None):
+    plt = import_pyplot(plot_file_name is not None)
+    for stream_index in sorted(table):
+        plt.plot(*downsample_min_max(table[stream_index], max_points), label="stream {}".format(stream_index))
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.legend()
+    show_plot(plt, plot_file_name)
+
+def draw_gop_histogram(table, title, xlabel, ylabel, bins=DEFAULT_GOP_HISTOGRAM_BINS, plot_file_name=None):
+    plt = import_pyplot(plot_file_name is not None)
+    for stream_index in sorted(table):
+        plt.stairs(*gop_histogram(table[stream_index], bins), label="stream {}".format(stream_index))
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.legend()
+    show_plot(plt, plot_file_name)
+
+def main(argv):
+    input = None
+    output = None
+    stream_index = None
+    all_streams = False
+    export_plot = False
+    export_xlsx = False
+    probe = False
+    ffprobe = DEFAULT_FFPROBE
+    workers = 1
+    batch = False
+    cache = False
+    cache_dir = default_frame_cache_dir()
+    cache_size = DEFAULT_FRAME_CACHE_SIZE
+    cache_hash = False
+    refresh_cache = False
+    clear_cache = False
+    plot_points = None
+    plot_file = None
+    follow = False
+    follow_window = DEFAULT_FOLLOW_WINDOW
+    target_gop = None
+    tolerance = DEFAULT_GOP_TOLERANCE
+    summary_interval = DEFAULT_FOLLOW_SUMMARY_INTERVAL
+    histogram_bins = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hxpmbci:s:o:j:", ["ffprobe=", "cache-dir=", "cache-size=", "cache-hash", "refresh-cache", "clear-cache", "plot-points=", "plot-file=",
+                                                            "follow", "window=", "target-gop=", "tolerance=", "summary-interval=", "histogram="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            print("input file shall be output of ffprobe -i -show_frames, use -i - to read it from stdin")
+            print("with -m, input file is a media file and ffprobe is run on it directly")
+            print("with -j, input file is parsed in chunks by <workers> processes")
+            print("with -b, input is a directory or glob, files are analyzed by <workers> processes and")
+            print("a gop summary is written to <outputfile> (.csv or .json), or printed as csv without -o,")
+            print("a gop further than <ratio> from the median of its stream counts as irregular")
+            print("with -c, parsed frames are cached in <dir> keyed by path, size and mtime (and content with --cache-hash),")
+            print("--refresh-cache reparses the input, --clear-cache removes all entries, the cache is bounded by <MB>")
+            print("with --plot-points, each plotted stream is reduced to about <n> points keeping bucket min and max")
+            print("with --plot-file, the plot is saved to <imagefile> instead of being shown")
+            print("with --follow, a growing input file, stdin or a live ffprobe (-m) is followed, rolling stats of the")
+            print("last <n> gops, and how long no i frame arrived, are printed every <seconds> even when the input")
+            print("stalls, and an alert is printed for each gop outside the tolerance")
+            print("of --target-gop, or of the window median when no target is given")
+            print("without --follow, --target-gop prints the drift from the target and the gops with missing or")
+            print("duplicate i frames, with -b they are counted in the summary")
+            print("with --histogram, -p plots a histogram of the gops of each stream in <bins> bins")
+            print("with -x to a .csv or .parquet <outputfile> and without -p and --target-gop, the rows are written")
+            print("in frame order while the input is read and the intervals are not printed")
+            sys.exit()
+        elif opt == "-x":
+            export_xlsx = True
+        elif opt == "-p":
+            export_plot = True
+        elif opt == "-m":
+            probe = True
+        elif opt == "-b":
+            batch = True
+        elif opt == "--ffprobe":
+            ffprobe = arg
+        elif opt == "-c":
+            cache = True
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            try:
+                cache_size = int(arg) * 1024 * 1024
+            except ValueError:
+                print("cache size shall be a number")
+                sys.exit(2)
+        elif opt == "--cache-hash":
+            cache_hash = True
+        elif opt == "--refresh-cache":
+            refresh_cache = True
+        elif opt == "--clear-cache":
+            clear_cache = True
+        elif opt == "--plot-points":
+            try:
+                plot_points = int(arg)
+            except ValueError:
+                print("plot points shall be a number")
+                sys.exit(2)
+            # a bucket keeps its min and max, so less than 2 points leaves no bucket to plot
+            if plot_points < 2:
+                print("plot points shall be at least 2")
+                sys.exit(2)
+        elif opt == "--plot-file":
+            plot_file = arg
+        elif opt == "--histogram":
+            try:
+                histogram_bins = int(arg)
+            except ValueError:
+                print("histogram bins shall be a number")
+                sys.exit(2)
+            if histogram_bins < 1:
+                print("histogram bins shall be at least 1")
+                sys.exit(2)
+        elif opt == "--follow":
+            follow = True
+        elif opt in ("--window", "--target-gop", "--tolerance", "--summary-interval"):
+            try:
+                value = int(arg) if opt == "--window" else float(arg)
+            except ValueError:
+                print("{} shall be a number".format(opt[2:].replace("-", " ")))
+                sys.exit(2)
+            # a zero summary interval would spin the timer, a window keeps at least one gop, a target gop is a duration
+            if opt != "--tolerance" and value <= 0:
+                print("{} shall be a positive number".format(opt[2:].replace("-", " ")))
+                sys.exit(2)
+            if opt == "--window":
+                follow_window = value
+            elif opt == "--target-gop":
+                target_gop = value
+            elif opt == "--tolerance":
+                tolerance = value
+            else:
+                summary_interval = value
+        elif opt == "-i":
+            input = arg
+        elif opt == "-s" and arg == "all":
+            all_streams = True
+        elif opt == "-s":
+            try:
+                stream_index = int(arg)
+            except ValueError:
+                print("stream_index shall be a number or all")
+                sys.exit(2)
+        elif opt == "-o":
+            output = arg
+        elif opt == "-j":
+            try:
+                workers = int(arg)
+            except ValueError:
+                print("workers shall be a number")
+                sys.exit(2)
+    
+    if clear_cache:
+        clear_frame_cache(cache_dir)
+        if input is None:
+            return
+
+    if batch:
+        if input is None:
+            print("invalid input")
+            sys.exit(2)
+        rows = batch_analysis(find_batch_inputs(input), stream_index, workers, probe, ffprobe, tolerance, target_gop)
+        write_summary(rows, output)
+        if any(row["error"] is not None for row in rows):
+            sys.exit(1)
+        return
+
+    if input is None or (input != "-" and probe == False and os.path.exists(input) == False) or (stream_index is None and all_streams == False):
+        print("invalid input")
+        sys.exit(2)
+
+    if follow:
+        monitor = GopMonitor(follow_window, target_gop, tolerance)
+        if probe:
+            frames = probe_frames(input, stream_index, ffprobe)
+        elif input == "-":
+            frames = iter_frames(sys.stdin)
+        else:
+            frames = iter_frames(follow_lines(input))
+        try:
+            follow_i_frame(frames, monitor, stream_index, summary_interval)
+        except KeyboardInterrupt:
+            pass
+        except (OSError, subprocess.CalledProcessError) as error:
+            print("fail to read frames: {}".format(error))
+            sys.exit(2)
+        for line in monitor.summary():
+            print(line)
+        return
+
+    # a csv or parquet export that is neither plotted nor checked is written while the frames are read,
+    # the intervals are not kept in memory and not printed
+    if (export_xlsx and output is not None and (output.endswith(".csv") or output.endswith(".parquet")) and
+            export_plot == False and target_gop is None):
+        try:
+            if cache and input != "-":
+                table = cached_frame_table(input, cache_dir, probe, ffprobe, workers, cache_hash, refresh_cache, cache_size)
+                rows = iter_table_rows(table.i_frame_interval_table() if all_streams else {stream_index: table.i_frame_interval(stream_index)})
+            else:
+                selected_index = None if all_streams else stream_index
+                frames = probe_frames(input, selected_index, ffprobe) if probe else read_frame_info_parallel(input, workers)
+                rows = iter_i_frame_interval_rows(frames, selected_index)
+            export_rows(rows, output)
+        except (OSError, subprocess.CalledProcessError) as error:
+            print("fail to read frames: {}".format(error))
+            sys.exit(2)
+        return
+
+    try:
+        if cache and input != "-":
+            table = cached_frame_table(input, cache_dir, probe, ffprobe, workers, cache_hash, refresh_cache, cache_size)
+            if all_streams:
+                i_frame_interval_table = {cur_index: i_frame_interval.tolist() for cur_index, i_frame_interval in table.i_frame_interval_table().items()}
+            else:
+                i_frame_interval_list = table.i_frame_interval(stream_index).tolist()
+        elif all_streams and probe:
+            i_frame_interval_table = probe_i_frame_all_streams(input, ffprobe)
+        elif all_streams:
+            i_frame_interval_table = caculate_i_frame_all_streams(input, workers)
+        elif probe:
+            i_frame_interval_list = probe_i_frame(input, stream_index, ffprobe)
+        else:
+            i_frame_interval_list = caculate_i_frame(input, stream_index, workers)
+    except (OSError, subprocess.CalledProcessError) as error:
+        print("fail to read frames: {}".format(error))
+        sys.exit(2)
+
+    if all_streams:
+        for cur_index in sorted(i_frame_interval_table):
+            print("stream {}: {}".format(cur_index, i_frame_interval_table[cur_index]))
+    else:
+        print(i_frame_interval_list)
+
+    if target_gop is not None:
+        checked_table = i_frame_interval_table if all_streams else {stream_index: i_frame_interval_list}
+        for cur_index in sorted(checked_table):
+            for line in gop_check_lines(cur_index, checked_table[cur_index], target_gop, tolerance):
+                print(line)
+
+    if export_plot:
+        if histogram_bins is not None:
+            draw_gop_histogram(i_frame_interval_table if all_streams else {stream_index: i_frame_interval_list},
+                               "gop histogram", "gop", "count", histogram_bins, plot_file)
+        elif all_streams:
+            draw_by_table(i_frame_interval_table, "i frame interval", "i frame", "interval", plot_points, plot_file)
+        else:
+            draw_by_list(i_frame_interval_list, "i frame interval", "i frame", "interval", plot_points, plot_file)
+    
+    if export_xlsx:
+        if output is None:
+            print("invalid output")
+            sys.exit(2)
+        if output.endswith(".csv") or output.endswith(".parquet"):
+            export_rows(iter_table_rows(i_frame_interval_table if all_streams else {stream_index: i_frame_interval_list}), output)
+        elif all_streams:
+            table_to_excel(i_frame_interval_table, output)
+        else:
+            list_to_excel(i_frame_interval_list, output)
+
+if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,170 @@
+'''
+    Include resolution and type facts for gtest_generator
+    #include directives are resolved against the configured include paths, quoted includes are
+    looked up next to the including header first. The graph is memoized, so in a batch run every
+    transitively included header is read and parsed once per process, with a model cache the
+    parse is shared across processes and runs too.
+    TypeFacts collects what the declarations of a header and its includes tell about a type:
+    pointer typedefs, forward declared (incomplete) classes, classes without a public constructer
+    and their static accessors, e.g. a singleton's getInstance
+    Known issues:
+    1. Types are matched by their unqualified name, classes of the same name in different
+       namespaces share their facts
+    2. Include paths of system headers are not configured by default, only what -I names is resolved
+'''
+
+import os
+import functools
+from cpp_header_parser import ClassAccessControl, DeclarationKind
+from header_model_cache import loadHeaderModel
+
+class TypeFacts:
+    def __init__(self):
+        self.pointer_types = set()
+        self.forward_declared = set()
+        self.defined = set()
+        self.no_public_constructer = set()
+        self.instance_accessors = {}
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def typeKey(type):
+        # "const ns::Foo&" and "Foo" share the key "Foo"
+        type = type.strip()
+        if type.startswith("const "):
+            type = type[6:]
+        return type.rstrip("&").strip().rpartition("::")[2]
+
+    def addModel(self, model):
+        constructers = []
+        for declaration in model.declarations:
+            if declaration.kind == DeclarationKind.CLASS_BEGIN:
+                self.defined.add(declaration.name)
+                constructers.append([])
+            elif declaration.kind == DeclarationKind.CLASS_END:
+                access_list = constructers.pop()
+                if len(access_list) > 0 and ClassAccessControl.PUBLIC not in access_list:
+                    self.no_public_constructer.add(self.typeKey(declaration.class_name))
+            elif declaration.kind == DeclarationKind.CONSTRUCTER and len(constructers) > 0:
+                constructers[-1].append(declaration.access)
+            elif declaration.kind == DeclarationKind.FORWARD_DECLARATION:
+                self.forward_declared.add(declaration.name)
+            elif declaration.kind == DeclarationKind.TYPEDEF:
+                if declaration.return_type.endswith("*") or declaration.return_type.endswith(")"):
+                    self.pointer_types.add(declaration.name)
+            elif declaration.kind == DeclarationKind.FUNCTION and declaration.class_name is not None:
+                self.addAccessor(declaration)
+
+    def addAccessor(self, declaration):
+        # static Foo& getInstance() or static Foo* instance() of class Foo
+        class_key = self.typeKey(declaration.class_name)
+        return_type = declaration.return_type.strip()
+        if "static" not in declaration.specifiers or declaration.access != ClassAccessControl.PUBLIC:
+            return
+        if len([arg for arg in declaration.args if arg.default is None and arg.type != "..."]) > 0:
+            return
+        if return_type.endswith("&") and self.typeKey(return_type) == class_key:
+            self.instance_accessors.setdefault(class_key, "{}::{}()".format(declaration.class_name, declaration.name))
+        elif return_type.endswith("*") and self.typeKey(return_type.rstrip("*")) == class_key:
+            self.instance_accessors.setdefault(class_key, "*{}::{}()".format(declaration.class_name, declaration.name))
+
+    def isPointer(self, type):
+        return self.typeKey(type) in self.pointer_types
+
+    def isIncomplete(self, type):
+        key = self.typeKey(type)
+        return key in self.forward_declared and key not in self.defined
+
+    def instanceAccessor(self, type):
+        # the expression giving a reference to an instance of a class that cannot be constructed
+        key = self.typeKey(type)
+        if key in self.no_public_constructer:
+            return self.instance_accessors.get(key)
+        return None
+
+    def isUnconstructible(self, type):
+        return self.isIncomplete(type) or self.typeKey(type) in self.no_public_constructer
+
+    @staticmethod
+    def fromModels(models):
+        facts = TypeFacts()
+        for model in models:
+            facts.addModel(model)
+        return facts
+
+class IncludeGraph:
+    def __init__(self, include_paths, model_cache_dir=None):
+        self.include_paths = list(include_paths)
+        self.model_cache_dir = model_cache_dir
+        self.resolved = {}
+        self.models = {}
+        self.included = {}
+
+    def resolve(self, name, is_system, including_file):
+        directory = os.path.dirname(os.path.abspath(including_file))
+        key = (name, None if is_system else directory)
+        if key not in self.resolved:
+            search_paths = self.include_paths if is_system else [directory] + self.include_paths
+            self.resolved[key] = None
+            for search_path in search_paths:
+                path = os.path.normpath(os.path.join(search_path, name))
+                if os.path.isfile(path):
+                    self.resolved[key] = os.path.abspath(path)
+                    break
+        return self.resolved[key]
+
+    def model(self, path, model=None):
+        if model is not None:
+            # a model given by the caller is at least as fresh as the memoized one
+            self.models[path] = model
+        elif path not in self.models:
+            if model is None:
+                try:
+                    model = loadHeaderModel(path, self.model_cache_dir)
+                except (OSError, UnicodeDecodeError):
+                    # an unreadable header only loses its facts
+                    model = None
+            self.models[path] = model
+        return self.models[path]
+
+    def invalidate(self, path):
+        # a changed header may include other headers now, so every closure is computed again
+        self.models.pop(os.path.abspath(path), None)
+        self.included = {}
+        self.resolved = {}
+
+    def includedFiles(self, path, model=None):
+        # every header reachable from path, path itself excluded, cycles are followed once
+        path = os.path.abspath(path)
+        if path in self.included:
+            return self.included[path]
+        included = []
+        visited = {path}
+        stack = [(path, model)]
+        while len(stack) > 0:
+            cur_path, cur_model = stack.pop()
+            cur_model = self.model(cur_path, cur_model)
+            if cur_model is None:
+                continue
+            for name, is_system in cur_model.includes:
+                include = self.resolve(name, is_system, cur_path)
+                if include is not None and include not in visited:
+                    visited.add(include)
+                    included.append(include)
+                    stack.append((include, None))
+        self.included[path] = included
+        return included
+
+    def typeFacts(self, path, model=None):
+        path = os.path.abspath(path)
+        models = [self.model(path, model)] + [self.model(include) for include in self.includedFiles(path, model)]
+        return TypeFacts.fromModels(model for model in models if model is not None)
+
+# one graph per process and configuration, shared by every header of a batch run
+include_graphs = {}
+
+def sharedIncludeGraph(include_paths, model_cache_dir=None):
+    key = (tuple(include_paths), model_cache_dir)
+    if key not in include_graphs:
+        include_graphs[key] = IncludeGraph(include_paths, model_cache_dir)
+    return include_graphs[key]
@@ -0,0 +1,120 @@
+'''
+    Tests for cpp_header_parser
+    Every case is a small header parsed by buildHeaderModel, the declarations are compared by kind and name
+    Run with python -m unittest test_cpp_header_parser or python -m pytest
+'''
+
+import unittest
+
+from cpp_header_parser import DeclarationKind, ClassAccessControl, Argument, buildHeaderModel
+
+def parse(text):
+    return buildHeaderModel("test.h", text).declarations
+
+def declarations(text, kind):
+    return [declaration for declaration in parse(text) if declaration.kind == kind]
+
+def functions(text):
+    return {declaration.name: declaration for declaration in declarations(text, DeclarationKind.FUNCTION)}
+
+class HeaderParserTest(unittest.TestCase):
+    def test_multi_line_arguments(self):
+        function = functions("int add(int a,\n        const std::string& b,\n        char* c);\n")["add"]
+        self.assertEqual(function.return_type, "int")
+        self.assertEqual(function.args, [Argument("int", "a"), Argument("const std::string&", "b"), Argument("char*", "c")])
+
+    def test_inline_bodies(self):
+        text = ("class Foo\n"
+                "{\n"
+                "public:\n"
+                "    int get() const { if (x) { return 1; } return 0; }\n"
+                "    void set(int value) { x = value; };\n"
+                "private:\n"
+                "    int x;\n"
+                "};\n"
+                "void after();\n")
+        declared = functions(text)
+        self.assertEqual(sorted(declared), ["after", "get", "set"])
+        self.assertEqual(declared["get"].class_name, "Foo")
+        self.assertEqual(declared["get"].qualifiers, ["const"])
+        self.assertTrue(declared["set"].has_body)
+        # the "};" of an inline body does not close the class
+        self.assertIsNone(declared["after"].class_name)
+
+    def test_default_arguments_with_commas(self):
+        function = functions("void f(std::map<int, int> m = std::map<int, int>{}, int n = g(1, 2), int k = 3);\n")["f"]
+        self.assertEqual([arg.name for arg in function.args], ["m", "n", "k"])
+        self.assertEqual(function.args[0].type, "std::map<int, int>")
+        self.assertEqual(function.args[1].default, "g(1, 2)")
+        self.assertEqual(function.args[2].default, "3")
+
+    def test_nested_namespaces(self):
+        text = ("namespace a { namespace b::c {\n"
+                "class Foo { public: void run(); };\n"
+                "} }\n")
+        begins = declarations(text, DeclarationKind.NAMESPACE_BEGIN)
+        self.assertEqual([begin.qualified_name for begin in begins], ["a", "a::b", "a::b::c"])
+        self.assertEqual(len(declarations(text, DeclarationKind.NAMESPACE_END)), 3)
+        self.assertEqual(declarations(text, DeclarationKind.CLASS_BEGIN)[0].qualified_name, "a::b::c")
+
+    def test_std_function(self):
+        text = ("class Foo\n"
+                "{\n"
+                "public:\n"
+                "    std::function<void(int)> callback;\n"
+                "    std::function<void(int)> getCallback();\n"
+                "    void setCallback(std::function<void(int, char)> callback);\n"
+                "};\n")
+        declared = functions(text)
+        self.assertEqual(sorted(declared), ["getCallback", "setCallback"])
+        self.assertEqual(declared["getCallback"].return_type, "std::function<void(int)>")
+        self.assertEqual(declared["setCallback"].args, [Argument("std::function<void(int, char)>", "callback")])
+
+    def test_class_head_attributes(self):
+        text = ("class __attribute__((visibility(\"default\"))) Vis { public: void a(); };\n"
+                "class API Exp : public Vis { public: int b(int x); };\n"
+                "struct alignas(16) [[deprecated]] Al final { void c(); };\n")
+        self.assertEqual([begin.name for begin in declarations(text, DeclarationKind.CLASS_BEGIN)], ["Vis", "Exp", "Al"])
+        declared = functions(text)
+        self.assertEqual(sorted(declared), ["a", "b", "c"])
+        self.assertEqual(declared["b"].class_name, "Exp")
+
+    def test_function_attributes(self):
+        function = functions("[[nodiscard]] int f(int a) __attribute__((warn_unused_result));\n")["f"]
+        self.assertEqual(function.return_type, "int")
+        self.assertEqual(function.qualifiers, [])
+
+    def test_access_and_constructers(self):
+        text = ("class Foo\n"
+                "{\n"
+                "    Foo(int a);\n"
+                "public:\n"
+                "    explicit Foo(const Foo& other);\n"
+                "    ~Foo();\n"
+                "    Foo& operator=(const Foo& other);\n"
+                "    void run();\n"
+                "};\n")
+        constructers = declarations(text, DeclarationKind.CONSTRUCTER)
+        self.assertEqual([constructer.access for constructer in constructers], [ClassAccessControl.PRIVATE, ClassAccessControl.PUBLIC])
+        self.assertEqual(list(functions(text)), ["run"])
+
+    def test_type_declarations(self):
+        text = ("class Fwd;\n"
+                "typedef unsigned long Size;\n"
+                "typedef void (*Callback)(int);\n"
+                "using Name = std::string;\n")
+        self.assertEqual([forward.name for forward in declarations(text, DeclarationKind.FORWARD_DECLARATION)], ["Fwd"])
+        typedefs = {typedef.name: typedef.return_type for typedef in declarations(text, DeclarationKind.TYPEDEF)}
+        self.assertEqual(typedefs, {"Size": "unsigned long", "Callback": "void(*)(int)", "Name": "std::string"})
+
+    def test_skipped_statements(self):
+        text = ("template <typename T> class Box { public: T get(); };\n"
+                "enum class Color { Red, Green };\n"
+                "struct { int x; } anonymous;\n"
+                "int variable = compute(1);\n"
+                "void kept();\n")
+        self.assertEqual(list(functions(text)), ["kept"])
+        self.assertEqual(declarations(text, DeclarationKind.CLASS_BEGIN), [])
+
+if __name__ == "__main__":
+    unittest.main()
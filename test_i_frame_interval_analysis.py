@@ -0,0 +1,134 @@
+'''
+    Tests for the ffprobe driver of i_frame_interval_analysis
+    A fake ffprobe script stands in for the real binary, it prints a fixed compact
+    output, records its arguments and exits with a given code
+    Run with python -m unittest test_i_frame_interval_analysis or python -m pytest
+'''
+
+import sys
+import os
+import json
+import stat
+import io
+import contextlib
+import tempfile
+import subprocess
+import unittest
+
+import i_frame_interval_analysis as analysis
+
+FAKE_FFPROBE_TEMPLATE = (
+    "#!{python}\n"
+    "import sys\n"
+    "import json\n"
+    "with open({args_file!r}, 'w') as file_object:\n"
+    "    json.dump(sys.argv[1:], file_object)\n"
+    "sys.stdout.write({output!r})\n"
+    "sys.exit({returncode})\n"
+)
+
+COMPACT_OUTPUT = (
+    "stream_index=0|pts_time=0.000000|pict_type=I|pkt_size=51234\n"
+    "stream_index=1|pts_time=0.000000|pict_type=I|pkt_size=N/A\n"
+    "stream_index=0|pts_time=N/A|pict_type=P|pkt_size=\n"
+    "stream_index=0|pts_time=1.000000|pict_type=B|pkt_size=1200\n"
+    "stream_index=1|pts_time=|pict_type=|pkt_size=800\n"
+    "stream_index=0|pts_time=2.000000|pict_type=I|pkt_size=48000\n"
+    "stream_index=1|pts_time=2.500000|pict_type=I|pkt_size=47000\n"
+)
+
+COMPACT_FRAMES = [
+    (0, 0.0, "I", 51234),
+    (1, 0.0, "I", None),
+    (0, 0, "P", None),
+    (0, 1.0, "B", 1200),
+    (1, 0, None, 800),
+    (0, 2.0, "I", 48000),
+    (1, 2.5, "I", 47000),
+]
+
+@unittest.skipIf(os.name == "nt", "the fake ffprobe is run through its shebang line")
+class FakeFfprobeTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.args_file = os.path.join(self.temp_dir.name, "args.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fake_ffprobe(self, output=COMPACT_OUTPUT, returncode=0):
+        ffprobe = os.path.join(self.temp_dir.name, "ffprobe")
+        with open(ffprobe, "w") as file_object:
+            file_object.write(FAKE_FFPROBE_TEMPLATE.format(python=sys.executable, args_file=self.args_file,
+                                                           output=output, returncode=returncode))
+        os.chmod(ffprobe, os.stat(ffprobe).st_mode | stat.S_IXUSR)
+        return ffprobe
+
+    def ffprobe_args(self):
+        with open(self.args_file) as file_object:
+            return json.load(file_object)
+
+    def test_iter_compact_frames(self):
+        self.assertEqual(list(analysis.iter_compact_frames(COMPACT_OUTPUT.splitlines(True))), COMPACT_FRAMES)
+
+    def test_iter_compact_frames_missing_fields(self):
+        frames = list(analysis.iter_compact_frames(["stream_index=N/A|pts_time=N/A\n", "pict_type=I\n", "\n"]))
+        self.assertEqual(frames, [(None, 0, None, None), (None, 0, "I", None), (None, 0, None, None)])
+
+    def test_probe_frames(self):
+        frames = list(analysis.probe_frames("video.mp4", None, self.fake_ffprobe()))
+        self.assertEqual(frames, COMPACT_FRAMES)
+        self.assertEqual(self.ffprobe_args(), analysis.FFPROBE_ARGS + ["video.mp4"])
+
+    def test_probe_frames_select_stream(self):
+        list(analysis.probe_frames("video.mp4", 1, self.fake_ffprobe()))
+        self.assertEqual(self.ffprobe_args(), analysis.FFPROBE_ARGS + ["-select_streams", "1", "video.mp4"])
+
+    def test_probe_frames_stdin(self):
+        list(analysis.probe_frames("-", None, self.fake_ffprobe()))
+        self.assertEqual(self.ffprobe_args()[-1], "pipe:0")
+
+    def test_probe_frames_nonzero_exit(self):
+        frames = []
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            for frame in analysis.probe_frames("video.mp4", None, self.fake_ffprobe(COMPACT_OUTPUT.splitlines(True)[0], 1)):
+                frames.append(frame)
+        self.assertEqual(context.exception.returncode, 1)
+        # the frames written before the failure are still yielded
+        self.assertEqual(frames, COMPACT_FRAMES[:1])
+
+    def test_probe_frames_missing_ffprobe(self):
+        with self.assertRaises(OSError):
+            list(analysis.probe_frames("video.mp4", None, os.path.join(self.temp_dir.name, "missing")))
+
+    def test_probe_i_frame(self):
+        ffprobe = self.fake_ffprobe()
+        self.assertEqual(analysis.probe_i_frame("video.mp4", 0, ffprobe), [0.0, 2.0])
+        self.assertEqual(analysis.probe_i_frame_all_streams("video.mp4", ffprobe), {0: [0.0, 2.0], 1: [0.0, 2.5]})
+
+    def test_main_probe(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            analysis.main(["-m", "-i", "video.mp4", "-s", "0", "--ffprobe", self.fake_ffprobe()])
+        self.assertEqual(output.getvalue(), "[0.0, 2.0]\n")
+
+    def test_main_probe_export_csv(self):
+        csv_file = os.path.join(self.temp_dir.name, "intervals.csv")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            analysis.main(["-m", "-x", "-i", "video.mp4", "-s", "all", "-o", csv_file, "--ffprobe", self.fake_ffprobe()])
+        # the rows are written in frame order and the intervals are not printed
+        self.assertEqual(output.getvalue(), "")
+        with open(csv_file) as file_object:
+            self.assertEqual(file_object.read().splitlines(),
+                             ["stream,i_frame,interval", "0,0,0.0", "1,0,0.0", "0,1,2.0", "1,1,2.5"])
+
+    def test_main_probe_nonzero_exit(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(SystemExit) as context:
+            analysis.main(["-m", "-i", "video.mp4", "-s", "0", "--ffprobe", self.fake_ffprobe("", 1)])
+        self.assertEqual(context.exception.code, 2)
+        self.assertTrue(output.getvalue().startswith("fail to read frames"))
+
+if __name__ == "__main__":
+    unittest.main()
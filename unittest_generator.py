@@ -0,0 +1,552 @@
+'''
+    Create both gtest unittest file and stub file according to header file
+    The header is parsed once and the same model is emitted by GtestGenerator and StubGenerator,
+    the output is the same as running gtest_generator.py and stub_generator.py separately
+    With -b, every header under the input directories or globs is generated by a process pool,
+    and the source tree is mirrored into the output root
+    With -u, a manifest of header hashes, generator version and options is kept in the output
+    root, unchanged headers are skipped and outputs are only rewritten when their content changes
+    With --model-cache, parsed header models are kept in header_model_cache.py's persistent cache
+    With --parameterized, the tests are value-parameterized, see gtest_generator.py
+    With --shards N, every test file is split into N sources sharing one fixture header
+    With --unity N, the test sources of a batch are amalgamated into N unity sources balanced by size,
+    their tests are named after the header path below the input root, include the header by that path and
+    are kept in a namespace per header, so the input root shall be an include path of the unity build
+    With --output-list, the sources to compile are written one per line for the build system,
+    unity sources and the output list are not rewritten by -w
+    With --fixture-instance, the instance under test is constructed by a fixture, see gtest_generator.py
+    With --prelude, stubs and tests include one shared prelude header instead of their common includes
+    With -I, includes are resolved against the include paths for the type facts of gtest_generator.py,
+    the include graph is shared by the headers of a batch run, the manifest of -u records the included
+    headers and -w regenerates the headers including a saved one
+    With --stats (or --profile), the time spent reading, matching, emitting and writing, lines/s and
+    peak memory are printed as json, see generator_benchmark.py for the benchmark against a baseline
+    With -w, the batch inputs are polled after the first run and headers saved since are regenerated,
+    a burst of saves is debounced and headers whose declarations did not change are not emitted again,
+    on Linux the saves are reported by inotify, elsewhere a poll stats the known headers and the inputs
+    are walked for new headers every --watch-rescan seconds
+'''
+
+import sys
+import getopt
+import os
+import glob
+import multiprocessing
+import hashlib
+import json
+import re
+import time
+from header_model_cache import loadHeaderModel
+from generator_output import OutputFile, GeneratorStats, balanceBySize, writeOutputList, writePrelude
+from include_graph import sharedIncludeGraph
+from header_watcher import HeaderWatcher
+import gtest_generator
+import stub_generator
+
+AVAILABLE_HEADER_FILE_SUFFIX_LIST = [".h", ".hxx"]
+
+USAGE = ("usage -i <input_file> -t <test_output_file> -s <stub_output_file_name_without_suffix> --no-access-control\n"
+         "      -b -i <input_dir_or_glob> [-i ...] -o <output_root> -j <jobs> -u (incremental) --no-access-control\n"
+         "      -b ... -w (watch) --watch-interval <seconds> --watch-debounce <seconds> --watch-rescan <seconds>\n"
+         "      -b ... --unity <count> --output-list <list_file>\n"
+         "      --model-cache <cache_dir> --parameterized --shards <count> --prelude <prelude_header>\n"
+         "      --fixture-instance <test|suite> -I <include_path> --stats")
+
+GENERATED = "generated"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+BATCH_CHUNK_SIZE = 8
+
+#bump when the generated content changes, so that an incremental run regenerates everything
+GENERATOR_VERSION = 8
+
+MANIFEST_FILE_NAME = ".unittest_generator_manifest.json"
+
+UNITY_FILE_NAME = "unity_test_{}.cpp"
+
+WATCH_INTERVAL = 0.1
+WATCH_DEBOUNCE = 0.2
+WATCH_RESCAN = 2.0
+
+def checkHeadFile(input):
+    if os.path.exists(input) == False:
+        return False
+    for suffix in AVAILABLE_HEADER_FILE_SUFFIX_LIST:
+        if input.endswith(suffix) == True:
+            return True
+    return False
+
+def generateAll(input, test_output, stub_output_header, stub_output_source, generator_options, model_cache_dir=None, model=None, stats=None,
+                unit=None):
+    if stats is None:
+        stats = GeneratorStats()
+    if model is None:
+        model = loadHeaderModel(input, model_cache_dir, stats=stats)
+    gtest_options = {key: value for key, value in generator_options.items() if key != "unity"}
+    with stats.emitting():
+        test_outputs = gtest_generator.generateGtest(input, test_output, model=model, model_cache_dir=model_cache_dir, unit_name=unit[0] if unit is not None else None,
+                                                     include_name=unit[1] if unit is not None else None, **gtest_options)
+        stub_generator.generateGtest(input, stub_output_header, stub_output_source, model, generator_options["prelude"])
+    return test_outputs + [stub_output_header, stub_output_source]
+
+def isHeaderFile(input):
+    for suffix in AVAILABLE_HEADER_FILE_SUFFIX_LIST:
+        if input.endswith(suffix) == True:
+            return True
+    return False
+
+def findHeaders(patterns):
+    # returns (header, root) pairs, root is the part of the path that is not mirrored
+    headers = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dir_path, dir_names, file_names in os.walk(pattern):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    if isHeaderFile(file_name):
+                        headers.append((os.path.join(dir_path, file_name), pattern))
+        else:
+            root = pattern
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            for header in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(header) and isHeaderFile(header):
+                    headers.append((header, root))
+    return headers
+
+def unitOf(header, root, generator_options):
+    # in a unity build the tests are named after the path below the root and include the header by it,
+    # so util.h of two directories do not collide, returns the unit name and the include name
+    if generator_options["unity"] == False:
+        return None
+    relative = os.path.relpath(header, root)
+    if relative == os.curdir:
+        relative = os.path.basename(header)
+    return re.sub(r"\W", "_", os.path.splitext(relative)[0]), relative.replace("\\", "/")
+
+def batchOutputs(header, root, output_root):
+    output_dir = os.path.join(output_root, os.path.dirname(os.path.relpath(header, root)))
+    stub_output_header, stub_output_source = stub_generator.defaultStubOutput(header)
+    return (os.path.join(output_dir, gtest_generator.defaultGtestOutput(header)),
+            os.path.join(output_dir, stub_output_header),
+            os.path.join(output_dir, stub_output_source))
+
+def expectedOutputs(header, root, output_root, generator_options):
+    # test outputs first, then stub header and stub source
+    test_output, stub_output_header, stub_output_source = batchOutputs(header, root, output_root)
+    if generator_options["shards"] > 1:
+        fixture_header, shard_sources = gtest_generator.gtestShardOutputs(test_output, generator_options["shards"])
+        return [fixture_header] + shard_sources + [stub_output_header, stub_output_source]
+    return [test_output, stub_output_header, stub_output_source]
+
+def sourceOutputs(entries):
+    test_sources = []
+    stub_sources = []
+    for key in sorted(entries):
+        outputs = entries[key]["outputs"]
+        if len(outputs) > 0:
+            test_sources += [output for output in outputs[:-2] if output.endswith(".cpp")]
+            stub_sources.append(outputs[-1])
+    return test_sources, stub_sources
+
+def writeUnityFiles(output_root, test_sources, count):
+    unity_files = [os.path.join(output_root, UNITY_FILE_NAME.format(i)) for i in range(count)]
+    groups = balanceBySize([os.path.getsize(test_source) for test_source in test_sources], count)
+    os.makedirs(output_root, exist_ok=True)
+    for unity_file, indexes in zip(unity_files, groups):
+        with OutputFile(unity_file) as output_file:
+            for index in indexes:
+                output_file.write("#include \"" + os.path.relpath(test_sources[index], output_root).replace("\\", "/") + "\"\n")
+    return unity_files
+
+def hashFile(file_name):
+    with open(file_name, 'rb') as file_object:
+        return hashlib.sha1(file_object.read()).hexdigest()
+
+def headerEntry(header, previous_entry):
+    # the hash is only recomputed when size or mtime changed
+    stat = os.stat(header)
+    if previous_entry is not None and previous_entry["size"] == stat.st_size and previous_entry["mtime"] == stat.st_mtime_ns:
+        content_hash = previous_entry["hash"]
+    else:
+        content_hash = hashFile(header)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": content_hash, "outputs": [], "dependencies": {}}
+
+def fileStat(file_name):
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def dependencyEntry(header, generator_options, model_cache_dir=None, model=None):
+    # size and mtime of every header included by header, as far as the include paths resolve it
+    if len(generator_options["include_paths"]) == 0:
+        return {}
+    include_graph = sharedIncludeGraph(generator_options["include_paths"], model_cache_dir)
+    return {path: fileStat(path) for path in include_graph.includedFiles(header, model)}
+
+def dependenciesChanged(entry):
+    return any(fileStat(path) != dependency_stat for path, dependency_stat in entry.get("dependencies", {}).items())
+
+def loadManifest(output_root, generator_options):
+    manifest_file = os.path.join(output_root, MANIFEST_FILE_NAME)
+    try:
+        with open(manifest_file, 'r') as file_object:
+            manifest = json.load(file_object)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != GENERATOR_VERSION or manifest.get("generator_options") != generator_options:
+        return {}
+    return manifest.get("headers", {})
+
+def saveManifest(output_root, generator_options, entries):
+    manifest_file = os.path.join(output_root, MANIFEST_FILE_NAME)
+    os.makedirs(output_root, exist_ok=True)
+    with open(manifest_file + ".tmp", 'w') as file_object:
+        json.dump({"version": GENERATOR_VERSION, "generator_options": generator_options, "headers": entries}, file_object, indent=4, sort_keys=True)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+def generateHeader(task):
+    # returns the stats report of the header as well, batchGenerate sums them up for --stats
+    header, root, output_root, generator_options, previous_entry, model_cache_dir = task
+    stats = GeneratorStats()
+    try:
+        entry = headerEntry(header, previous_entry) if previous_entry is not None else None
+        outputs = expectedOutputs(header, root, output_root, generator_options)
+        if entry is not None and entry["hash"] == previous_entry["hash"] and previous_entry["outputs"] in (outputs, []) \
+                and all(os.path.exists(output) for output in previous_entry["outputs"]) and not dependenciesChanged(previous_entry):
+            entry["outputs"] = previous_entry["outputs"]
+            entry["dependencies"] = previous_entry.get("dependencies", {})
+            return header, SKIPPED, None, entry, stats.report()
+        if entry is None:
+            entry = headerEntry(header, None)
+
+        model = loadHeaderModel(header, model_cache_dir, stats=stats)
+        entry["dependencies"] = dependencyEntry(header, generator_options, model_cache_dir, model)
+        if len(model.classes()) == 0 and len(model.functions()) == 0:
+            return header, SKIPPED, None, entry, stats.report()
+        test_output, stub_output_header, stub_output_source = batchOutputs(header, root, output_root)
+        os.makedirs(os.path.dirname(test_output) or ".", exist_ok=True)
+        entry["outputs"] = generateAll(header, test_output, stub_output_header, stub_output_source, generator_options, model_cache_dir, model, stats,
+                                       unitOf(header, root, generator_options))
+    except Exception as error:
+        return header, FAILED, str(error), None, stats.report()
+    return header, GENERATED, None, entry, stats.report()
+
+def batchGenerate(headers, output_root, generator_options, jobs=None, incremental=False, model_cache_dir=None, unity=0, output_list=None, stats=None):
+    manifest = loadManifest(output_root, generator_options) if incremental else {}
+    tasks = [(header, root, output_root, generator_options, manifest.get(os.path.abspath(header)), model_cache_dir) for header, root in headers]
+    summary = {GENERATED: [], SKIPPED: [], FAILED: []}
+    entries = {}
+    with multiprocessing.Pool(jobs) as pool:
+        for header, status, error, entry, report in pool.imap_unordered(generateHeader, tasks, BATCH_CHUNK_SIZE):
+            if stats is not None:
+                stats.add(report)
+            if status == FAILED:
+                print("fail to generate {}: {}".format(header, error))
+            else:
+                entries[os.path.abspath(header)] = entry
+            summary[status].append(header)
+    if incremental:
+        saveManifest(output_root, generator_options, entries)
+    test_sources, stub_sources = sourceOutputs(entries)
+    if unity > 0:
+        test_sources = writeUnityFiles(output_root, test_sources, unity)
+    if output_list is not None:
+        writeOutputList(output_list, test_sources + stub_sources)
+    return summary
+
+def generateWatchedHeader(header, root, output_root, generator_options, entry, models, model_cache_dir, dependencies_changed=False):
+    key = os.path.abspath(header)
+    model = loadHeaderModel(header, model_cache_dir)
+    entry["dependencies"] = dependencyEntry(header, generator_options, model_cache_dir, model)
+    if model.sameDeclarations(models.get(key)) and not dependencies_changed:
+        return SKIPPED
+    models[key] = model
+    if len(model.classes()) == 0 and len(model.functions()) == 0:
+        return SKIPPED
+    test_output, stub_output_header, stub_output_source = batchOutputs(header, root, output_root)
+    os.makedirs(os.path.dirname(test_output) or ".", exist_ok=True)
+    entry["outputs"] = generateAll(header, test_output, stub_output_header, stub_output_source, generator_options, model_cache_dir, model,
+                                   unit=unitOf(header, root, generator_options))
+    return GENERATED
+
+def watchInputs(watcher, patterns):
+    # the directories below the input directories and the roots of the globs, so new headers are seen
+    for pattern in patterns:
+        root = pattern
+        while glob.has_magic(root):
+            root = os.path.dirname(root)
+        if watcher.watchTree(root or os.curdir) == False:
+            return False
+    return True
+
+def watchDependencies(watcher, entries):
+    for entry in entries.values():
+        for path in entry["dependencies"]:
+            if watcher.watch(os.path.dirname(path) or os.curdir) == False:
+                return False
+    return True
+
+def watchGenerate(inputs, output_root, generator_options, model_cache_dir=None, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE,
+                  rescan=WATCH_RESCAN):
+    # models stay in memory between saves, a header is only re-emitted when its declarations changed
+    # or a header it includes was saved
+    seen = {}
+    entries = {}
+    models = {}
+    pending = {}
+    dependency_seen = {}
+    changed_dependencies = set()
+    last_change = 0
+    first_run = True
+    headers = None
+    header_roots = {}
+    next_rescan = 0
+    # with inotify a poll only stats the files reported as saved, otherwise every known header is stat'ed
+    watcher = HeaderWatcher.create()
+    while True:
+        changed_paths = None
+        if watcher is not None:
+            changed_paths, structure_changed = watcher.changes()
+            rescan_now = (headers is None or structure_changed or
+                          any(isHeaderFile(path) and (path not in header_roots or os.path.exists(path) == False)
+                              for path in changed_paths))
+        else:
+            # walking the inputs is what a poll costs on a large tree, so new and removed headers are only
+            # found every rescan seconds
+            rescan_now = time.monotonic() >= next_rescan
+        if rescan_now:
+            headers = findHeaders(inputs)
+            header_roots = dict((os.path.abspath(header), (header, root)) for header, root in headers)
+            next_rescan = time.monotonic() + rescan
+            if watcher is not None and (watchInputs(watcher, inputs) == False or watchDependencies(watcher, entries) == False):
+                print("fail to watch the inputs with inotify, polling them instead")
+                watcher.close()
+                watcher = None
+            changed_paths = None
+        if changed_paths is None:
+            polled = header_roots.items()
+        else:
+            polled = [(key, header_roots[key]) for key in changed_paths if key in header_roots]
+        for key, (header, root) in polled:
+            try:
+                stat = os.stat(header)
+            except OSError:
+                continue
+            # the debounce restarts on every save, so a burst is regenerated once it settles
+            if seen.get(key) != (stat.st_size, stat.st_mtime_ns):
+                seen[key] = (stat.st_size, stat.st_mtime_ns)
+                pending[key] = (header, root)
+                last_change = time.monotonic()
+        # included headers are polled as well, the headers including a saved one are regenerated
+        for key, entry in entries.items() if changed_paths is None or len(changed_paths) > 0 else []:
+            for path, dependency_stat in entry["dependencies"].items():
+                if changed_paths is not None and os.path.abspath(path) not in changed_paths:
+                    continue
+                cur_stat = fileStat(path)
+                if dependency_seen.setdefault(path, dependency_stat) != cur_stat:
+                    dependency_seen[path] = cur_stat
+                    changed_dependencies.add(path)
+                    last_change = time.monotonic()
+        if rescan_now:
+            for key in seen.keys() - header_roots.keys():
+                del seen[key]
+                entries.pop(key, None)
+                models.pop(key, None)
+                pending.pop(key, None)
+
+        if (len(pending) > 0 or len(changed_dependencies) > 0) and (first_run or time.monotonic() - last_change >= debounce):
+            start = time.monotonic()
+            summary = {GENERATED: [], SKIPPED: [], FAILED: []}
+            changed_dependencies |= pending.keys()
+            dependents = set(key for key, entry in entries.items()
+                             if key in header_roots and not changed_dependencies.isdisjoint(entry["dependencies"]))
+            for key in dependents:
+                pending[key] = header_roots[key]
+            if len(generator_options["include_paths"]) > 0:
+                include_graph = sharedIncludeGraph(generator_options["include_paths"], model_cache_dir)
+                for path in changed_dependencies:
+                    include_graph.invalidate(path)
+            for key, (header, root) in sorted(pending.items()):
+                previous_entry = entries.get(key)
+                try:
+                    entry = headerEntry(header, previous_entry)
+                    if previous_entry is not None and entry["hash"] == previous_entry["hash"] and key not in dependents:
+                        entry["outputs"] = previous_entry["outputs"]
+                        entry["dependencies"] = previous_entry["dependencies"]
+                        status = SKIPPED
+                    else:
+                        entry["outputs"] = previous_entry["outputs"] if previous_entry is not None else []
+                        status = generateWatchedHeader(header, root, output_root, generator_options, entry, models, model_cache_dir,
+                                                       key in dependents)
+                    entries[key] = entry
+                except Exception as error:
+                    print("fail to generate {}: {}".format(header, error))
+                    status = FAILED
+                summary[status].append(header)
+            pending = {}
+            changed_dependencies = set()
+            if watcher is not None and watchDependencies(watcher, entries) == False:
+                print("fail to watch the inputs with inotify, polling them instead")
+                watcher.close()
+                watcher = None
+            if first_run:
+                print("generated: {}, skipped: {}, failed: {}".format(len(summary[GENERATED]), len(summary[SKIPPED]), len(summary[FAILED])))
+                print("watching {} headers".format(len(seen)))
+                first_run = False
+            else:
+                for header in summary[GENERATED]:
+                    print("regenerated {}".format(header))
+                print("{} changed, {} regenerated in {:.0f} ms".format(
+                    len(summary[GENERATED]) + len(summary[SKIPPED]) + len(summary[FAILED]), len(summary[GENERATED]), (time.monotonic() - start) * 1000))
+            sys.stdout.flush()
+        time.sleep(interval)
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hbuwi:t:s:o:j:I:", ["no-access-control", "model-cache=", "watch-interval=", "watch-debounce=", "watch-rescan=", "parameterized", "shards=", "unity=", "output-list=", "prelude=", "fixture-instance=", "stats", "profile"])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+
+    input = None
+    inputs = []
+    test_output = None
+    stub_output = None
+    generator_options = {"access_control": True, "parameterized": False, "shards": 1, "prelude": None, "fixture_instance": None,
+                         "include_paths": [], "unity": False}
+    unity = 0
+    output_list = None
+    stats = None
+    batch = False
+    output_root = "."
+    jobs = None
+    incremental = False
+    model_cache_dir = None
+    watch = False
+    watch_interval = WATCH_INTERVAL
+    watch_debounce = WATCH_DEBOUNCE
+    watch_rescan = WATCH_RESCAN
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        elif opt == "-b":
+            batch = True
+        elif opt == "-u":
+            incremental = True
+        elif opt == "-w":
+            watch = True
+        elif opt in ("--watch-interval", "--watch-debounce", "--watch-rescan"):
+            try:
+                seconds = float(arg)
+            except ValueError:
+                print("{} shall be a number".format(opt))
+                sys.exit(2)
+            if opt == "--watch-interval":
+                watch_interval = seconds
+            elif opt == "--watch-debounce":
+                watch_debounce = seconds
+            else:
+                watch_rescan = seconds
+        elif opt == "-i":
+            input = arg
+            inputs.append(arg)
+        elif opt == "-o":
+            output_root = arg
+        elif opt == "-j":
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                print("jobs shall be a positive number")
+                sys.exit(2)
+        elif opt == "-t":
+            test_output = arg
+        elif opt == "-s":
+            stub_output = arg
+        elif opt == "--no-access-control":
+            generator_options["access_control"] = False
+        elif opt == "--parameterized":
+            generator_options["parameterized"] = True
+        elif opt in ("--shards", "--unity"):
+            try:
+                count = int(arg)
+            except ValueError:
+                count = 0
+            if count < 1:
+                print("{} shall be a positive number".format(opt))
+                sys.exit(2)
+            if opt == "--shards":
+                generator_options["shards"] = count
+            else:
+                unity = count
+                generator_options["unity"] = True
+        elif opt == "--output-list":
+            output_list = arg
+        elif opt == "--prelude":
+            generator_options["prelude"] = arg
+        elif opt in ("--stats", "--profile"):
+            stats = GeneratorStats()
+        elif opt == "--fixture-instance":
+            if arg not in (gtest_generator.FIXTURE_INSTANCE_TEST, gtest_generator.FIXTURE_INSTANCE_SUITE):
+                print("fixture instance shall be {} or {}".format(gtest_generator.FIXTURE_INSTANCE_TEST, gtest_generator.FIXTURE_INSTANCE_SUITE))
+                sys.exit(2)
+            generator_options["fixture_instance"] = arg
+        elif opt == "--model-cache":
+            model_cache_dir = arg
+        elif opt == "-I":
+            generator_options["include_paths"].append(os.path.abspath(arg))
+
+    if watch and batch == False:
+        print("-w shall be used with -b")
+        sys.exit(2)
+
+    # written once here, the generators of every header only include it
+    if batch and generator_options["prelude"] is not None:
+        writePrelude(generator_options["prelude"])
+
+    if batch and watch:
+        try:
+            watchGenerate(inputs, output_root, generator_options, model_cache_dir, watch_interval, watch_debounce, watch_rescan)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if batch:
+        summary = batchGenerate(findHeaders(inputs), output_root, generator_options, jobs, incremental, model_cache_dir, unity, output_list, stats)
+        print("generated: {}, skipped: {}, failed: {}".format(len(summary[GENERATED]), len(summary[SKIPPED]), len(summary[FAILED])))
+        if stats is not None:
+            print(json.dumps(stats.report(), indent=4))
+        if len(summary[FAILED]) > 0:
+            sys.exit(1)
+        return
+
+    if input is None or checkHeadFile(input) == False:
+        print("invalid input")
+        sys.exit(2)
+
+    if test_output is None:
+        test_output = gtest_generator.defaultGtestOutput(input)
+    if stub_output is None:
+        stub_output_header, stub_output_source = stub_generator.defaultStubOutput(input)
+    else:
+        stub_output_header = stub_output + ".h"
+        stub_output_source = stub_output + ".cpp"
+
+    print("input: {}, test output: {}, stub output header: {}, stub output source: {}".format(input, test_output, stub_output_header, stub_output_source))
+    if generator_options["prelude"] is not None:
+        writePrelude(generator_options["prelude"])
+    outputs = generateAll(input, test_output, stub_output_header, stub_output_source, generator_options, model_cache_dir, stats=stats)
+    if stats is not None:
+        print(json.dumps(stats.report(), indent=4))
+    if output_list is not None:
+        writeOutputList(output_list, [output for output in outputs if output.endswith(".cpp")])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])